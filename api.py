@@ -1,71 +1,259 @@
 import aiohttp
+import logging
 import re
-from config import TVMAZE_URL
-from async_lru import alru_cache
+from urllib.parse import urlencode
+from config import (
+    TVMAZE_URL, HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_CACHE_ENDPOINTS, HTTP_CACHE_SIZE,
+    TVMAZE_RATE_CALLS, TVMAZE_RATE_PERIOD, TVMAZE_MAX_RETRIES,
+    SEARCH_CACHE_SIZE, SEARCH_MEMORY_TTL, SEARCH_CACHE_TTL, SEARCH_NEGATIVE_TTL, SEARCH_WARMUP_SIZE,
+    CATALOG_MATCH_SCORE, CATALOG_MATCH_MARGIN
+)
+from cache import AsyncTTLCache, ResponseCache
+from metrics import TVMAZE_SECONDS, TVMAZE_RESPONSES
+from ratelimit import RateLimiter
+
+
+class TVMazeError(Exception):
+    # TVMaze couldn't answer (5xx, rate limited past every retry, ...), unlike
+    # a 404 this says nothing about whether the show exists
+    pass
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
 
 class TVMazeClient:
-    @staticmethod
-    @alru_cache(maxsize=100)
-    async def search_show(query):
-        async with aiohttp.ClientSession() as session:
-            link_match = re.search(r'tvmaze\.com/shows/(\d+)', query)
-            if link_match:
-                show_id = link_match.group(1)
-                url = f"{TVMAZE_URL}/shows/{show_id}"
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return data['id'], data['name'], data['url']
-            else:
-                url = f"{TVMAZE_URL}/search/shows"
-                params = {'q': query}
-                async with session.get(url, params=params) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        if data:
-                            show = data[0]['show']
-                            return show['id'], show['name'], show['url']
-        return None, None, None
+    def __init__(self, base_url=TVMAZE_URL, db=None):
+        self.base_url = base_url
+        self.db = db
+        self.session = None
+        self.limiter = RateLimiter(TVMAZE_RATE_CALLS, TVMAZE_RATE_PERIOD)
+        self.responses = ResponseCache(db, maxsize=HTTP_CACHE_SIZE)
+        # Memory tier in front of the search_cache table
+        self.searches = AsyncTTLCache(
+            self._search_cached, ttl=SEARCH_MEMORY_TTL,
+            negative_ttl=min(SEARCH_MEMORY_TTL, SEARCH_NEGATIVE_TTL), maxsize=SEARCH_CACHE_SIZE
+        )
+        self.search_db_hits = 0
+        self.search_db_misses = 0
+        # TVMaze `updated` stamp last written to the shows table, per show
+        self.show_versions = {}
 
-    @staticmethod
-    async def get_latest_episode_with_info(show_id):
-        url = f"{TVMAZE_URL}/shows/{show_id}?embed=previousepisode"
-        async with aiohttp.ClientSession() as session:
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_SIZE,
+            ttl_dns_cache=300,
+            keepalive_timeout=60
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+        await self.responses.load()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _get_json(self, url, params=None, endpoint='shows'):
+        cache_key = None
+        if endpoint in HTTP_CACHE_ENDPOINTS:
+            cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        cached = self.responses.get(cache_key) if cache_key else None
+        headers = self.responses.conditional_headers(cached) if cached else None
+
+        for attempt in range(TVMAZE_MAX_RETRIES + 1):
+            await self.limiter.acquire()
             try:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
+                with TVMAZE_SECONDS.labels(endpoint).time():
+                    async with self.session.get(url, params=params, headers=headers) as resp:
+                        TVMAZE_RESPONSES.labels(endpoint, resp.status).inc()
+                        if resp.status == 429:
+                            retry_after = resp.headers.get('Retry-After', '')
+                            delay = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+                            logging.warning(f"TVMaze rate limit hit, backing off {delay}s")
+                            self.limiter.backoff(delay)
+                            continue
+                        if resp.status == 304 and cached:
+                            # Unchanged, hand back the object decoded last time
+                            self.responses.hits += 1
+                            return cached[2]
+                        if resp.status == 404:
+                            return None
+                        if resp.status != 200:
+                            raise TVMazeError(f"TVMaze {endpoint} request failed with status {resp.status}")
                         data = await resp.json()
+                        etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+            except TVMazeError:
+                raise
+            except Exception:
+                TVMAZE_RESPONSES.labels(endpoint, 'error').inc()
+                raise
 
-                        if '_embedded' not in data or 'previousepisode' not in data['_embedded']:
-                            return None
+            if cache_key:
+                self.responses.misses += 1
+                try:
+                    await self.responses.store(cache_key, etag, last_modified, data)
+                except Exception as e:
+                    logging.warning(f"HTTP cache write failed for {cache_key}: {e}")
+            return data
+        raise TVMazeError(f"TVMaze {endpoint} still rate limited after {TVMAZE_MAX_RETRIES} retries")
 
-                        ep_data = data['_embedded']['previousepisode']
-                        image_url = None
-                        if data.get('image') and data['image'].get('medium'):
-                            image_url = data['image']['medium']
-                        ep_data['show_image'] = image_url
+    @property
+    def search_db_hit_rate(self):
+        total = self.search_db_hits + self.search_db_misses
+        return self.search_db_hits / total if total else 0.0
 
-                        premiered = data.get('premiered')
-                        if premiered:
-                            ep_data['show_year'] = premiered[:4]
-                        else:
-                            ep_data['show_year'] = ""
+    async def warm_search_cache(self):
+        if not self.db:
+            return
+        rows = await self.db.get_popular_searches(SEARCH_WARMUP_SIZE, SEARCH_CACHE_TTL)
+        for row in rows:
+            self.searches.set(row['query'], (row['show_id'], row['name'], row['url']))
+        logging.info(f"🔥 Search cache warmed with {len(rows)} queries")
 
-                        return ep_data
-            except Exception:
-                return None
-        return None
+    async def search_show(self, query):
+        key = normalize_query(query)
+        if not key:
+            return None, None, None
+        return await self.searches.get(key) or (None, None, None)
+
+    async def _search_cached(self, query):
+        if self.db:
+            row = await self.db.get_cached_search(query, SEARCH_CACHE_TTL, SEARCH_NEGATIVE_TTL)
+            if row:
+                self.search_db_hits += 1
+                return (row['show_id'], row['name'], row['url']) if row['show_id'] else None
+            self.search_db_misses += 1
+
+            if not re.search(r'tvmaze\.com/shows/(\d+)', query):
+                matches = await self.db.search_catalog(query, 2, prefix_first=False)
+                if self._confident_match(matches):
+                    show = matches[0]
+                    result = show['show_id'], show['name'], show['url']
+                    await self.db.set_cached_search(query, result)
+                    return result
+
+        # A TVMazeError propagates from here, only a real miss gets cached as None
+        result = await self._search_tvmaze(query)
+        if self.db:
+            await self.db.set_cached_search(query, result)
+        return result
 
     @staticmethod
-    async def get_next_episode(show_id):
-        url = f"{TVMAZE_URL}/shows/{show_id}?embed=nextepisode"
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        if '_embedded' in data and 'nextepisode' in data['_embedded']:
-                            return data['_embedded']['nextepisode']
-            except Exception:
-                pass
-        return None
\ No newline at end of file
+    def _confident_match(matches):
+        # Matches are ordered by score; an exact name or a clear lead is safe to
+        # subscribe to and cache, a close call like "office" isn't
+        if not matches or matches[0]['score'] < CATALOG_MATCH_SCORE:
+            return False
+        if len(matches) == 1:
+            return True
+        best, runner_up = matches
+        if best['is_exact']:
+            return not runner_up['is_exact']
+        return best['score'] - runner_up['score'] >= CATALOG_MATCH_MARGIN
+
+    async def _search_tvmaze(self, query):
+        link_match = re.search(r'tvmaze\.com/shows/(\d+)', query)
+        if link_match:
+            show_id = link_match.group(1)
+            data = await self._get_json(f"{self.base_url}/shows/{show_id}")
+            if data:
+                await self._remember_show(data)
+                return data['id'], data['name'], data['url']
+        else:
+            data = await self._get_json(f"{self.base_url}/search/shows", params={'q': query}, endpoint='search')
+            if data:
+                show = data[0]['show']
+                await self._remember_show(show)
+                return show['id'], show['name'], show['url']
+        return None
+
+    async def _remember_show(self, show):
+        # Keeps the shows table current from payloads fetched anyway. A 304
+        # hands back the same object, so unchanged shows skip the write.
+        if not self.db or self.show_versions.get(show['id']) == show.get('updated'):
+            return
+        try:
+            await self.db.upsert_shows([show])
+            self.show_versions[show['id']] = show.get('updated')
+        except Exception as e:
+            logging.warning(f"Couldn't store show {show['id']}: {e}")
+
+    async def get_show_details(self, show_id):
+        # For the /add confirmation card. The search that found the show has
+        # usually stored it already, TVMaze is only asked for unknown shows.
+        row = await self.db.get_show(show_id) if self.db else None
+        if row:
+            year = row['premiered'].year if row['premiered'] else None
+            rating, status, genres = row['rating'], row['status'], row['genres']
+        else:
+            data = await self._get_json(f"{self.base_url}/shows/{show_id}")
+            if not data:
+                return None
+            await self._remember_show(data)
+            year = data['premiered'][:4] if data.get('premiered') else None
+            rating = (data.get('rating') or {}).get('average')
+            status, genres = data.get('status'), data.get('genres')
+
+        return {
+            'year': year or '????',
+            'rating': rating or 'N/A',
+            'status': status or 'Unknown',
+            'genres': ', '.join(genres or [])
+        }
+
+    async def get_latest_episode_with_info(self, show_id):
+        episodes = await self.get_episodes(show_id)
+        return episodes[0] if episodes else None
+
+    async def get_episodes(self, show_id):
+        # (previous episode with show info, next episode, show's updated stamp)
+        # from one request, None if the request itself failed
+        url = f"{self.base_url}/shows/{show_id}?embed[]=previousepisode&embed[]=nextepisode"
+        try:
+            data = await self._get_json(url)
+        except Exception:
+            return None
+        if not data:
+            return None
+        await self._remember_show(data)
+
+        embedded = data.get('_embedded', {})
+        next_ep = embedded.get('nextepisode')
+
+        updated = data.get('updated', 0)
+        if 'previousepisode' not in embedded:
+            return None, next_ep, updated
+
+        # Copy: the decoded payload is shared with the HTTP cache
+        ep_data = dict(embedded['previousepisode'])
+        image_url = None
+        if data.get('image') and data['image'].get('medium'):
+            image_url = data['image']['medium']
+        ep_data['show_image'] = image_url
+        ep_data['show_updated'] = updated
+
+        premiered = data.get('premiered')
+        if premiered:
+            ep_data['show_year'] = premiered[:4]
+        else:
+            ep_data['show_year'] = ""
+
+        return ep_data, next_ep, updated
+
+    async def get_shows_page(self, page):
+        # TVMaze's full show index, 250 shows per page; None past the last page
+        return await self._get_json(f"{self.base_url}/shows", params={'page': page}, endpoint='index')
+
+    async def get_show_updates(self, since='day'):
+        try:
+            data = await self._get_json(f"{self.base_url}/updates/shows", params={'since': since}, endpoint='updates')
+        except Exception:
+            return None
+        if data is None:
+            return None
+        return {int(show_id): updated for show_id, updated in data.items()}
\ No newline at end of file
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+# End-to-end benchmark: UpdateChecker sweep + delivery, /calendar and /add
+# against a fake TVMaze, a fake Bot and a throwaway Postgres database.
+#
+#   BENCH_DATABASE_URL=postgresql://localhost/pekseries_bench \
+#   BENCH_SUBSCRIPTIONS=100000 python benchmarks/bench_e2e.py
+#
+# BENCH_DIGEST=1 delivers through the per-user digest path instead.
+#
+# Every bot table in BENCH_DATABASE_URL is truncated first, never point it at production.
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL')
+SUBSCRIPTIONS = int(os.environ.get('BENCH_SUBSCRIPTIONS', 1000))
+SUBS_PER_USER = int(os.environ.get('BENCH_SUBS_PER_USER', 10))
+SHOWS = int(os.environ.get('BENCH_SHOWS', 2000))
+NEW_EPISODE_RATIO = float(os.environ.get('BENCH_NEW_EPISODE_RATIO', 0.2))
+TVMAZE_LATENCY = float(os.environ.get('BENCH_TVMAZE_LATENCY', 0.05))
+TVMAZE_429_RATE = float(os.environ.get('BENCH_TVMAZE_429_RATE', 0.0))
+BOT_LATENCY = float(os.environ.get('BENCH_BOT_LATENCY', 0.0))
+HANDLER_REQUESTS = int(os.environ.get('BENCH_HANDLER_REQUESTS', 200))
+DIGEST = os.environ.get('BENCH_DIGEST', '').lower() in ('1', 'true', 'yes')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', 'bench')
+# Measure our own overhead, not the production rate limits
+os.environ.setdefault('TVMAZE_RATE_CALLS', '1000000')
+os.environ.setdefault('DELIVERY_RATE', '1000000')
+os.environ.setdefault('DELIVERY_CHAT_INTERVAL', '0')
+
+from api import TVMazeClient
+from database import Database
+from delivery import NotificationQueue
+from handlers import process_add_show, show_calendar
+from metrics import DB_SECONDS
+from scheduler import UpdateChecker
+from fakes import FakeBot, FakeMessage, FakeState, FakeTVMaze, episode_id
+
+TABLES = (
+    'subscriptions', 'users', 'show_updates', 'upcoming_episodes', 'search_cache',
+    'posters', 'episodes', 'outbox', 'catalog', 'http_cache', 'shows'
+)
+
+
+def db_calls():
+    return sum(
+        sample.value for metric in DB_SECONDS.collect() for sample in metric.samples
+        if sample.name.endswith('_count')
+    )
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def seed(db):
+    users = max(1, SUBSCRIPTIONS // SUBS_PER_USER)
+    new_shows = set(random.sample(range(1, SHOWS + 1), int(SHOWS * NEW_EPISODE_RATIO)))
+
+    subs = []
+    for user_id in range(1, users + 1):
+        shows = set()
+        while len(shows) < min(SUBS_PER_USER, SHOWS):
+            # Skewed towards low ids so a few shows are very popular
+            shows.add(int(SHOWS * random.random() ** 2) + 1)
+        for show_id in shows:
+            last_ep = 0 if show_id in new_shows else episode_id(show_id)
+            subs.append((user_id, show_id, f"Show {show_id}", last_ep))
+
+    async with db.pool.acquire() as conn:
+        await conn.execute(f"TRUNCATE {', '.join(TABLES)}")
+        await conn.copy_records_to_table(
+            'users', records=[(u, None, 'Bench', None) for u in range(1, users + 1)],
+            columns=('user_id', 'username', 'first_name', 'last_name')
+        )
+        await conn.copy_records_to_table(
+            'subscriptions', records=subs, columns=('user_id', 'show_id', 'show_name', 'last_episode_id')
+        )
+        await conn.execute('ANALYZE')
+    return users, len(subs)
+
+
+async def bench_sweep(db, tvmaze, fake_tvmaze):
+    bot = FakeBot(latency=BOT_LATENCY)
+    notifier = NotificationQueue(bot, db)
+    await notifier.start()
+    checker = UpdateChecker(db, tvmaze, notifier, digest=DIGEST, digest_window=0)
+
+    api_before, db_before = sum(fake_tvmaze.calls.values()), db_calls()
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    await checker.sweep()
+    detected = time.perf_counter()
+    await (checker._drain_digests_once() if DIGEST else checker._drain_outbox_once())
+    await notifier.queue.join()
+    await notifier.close()
+    finished = time.perf_counter()
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sent = bot.calls['send_photo'] + bot.calls['send_message'] + bot.calls['send_media_group']
+    send_time = (bot.finished - bot.started) if sent else 0
+    print("== sweep")
+    print(f"detection:        {detected - started:.2f}s")
+    print(f"sweep + delivery: {finished - started:.2f}s")
+    print(f"TVMaze calls:     {sum(fake_tvmaze.calls.values()) - api_before} {dict(fake_tvmaze.calls)}")
+    print(f"DB calls:         {db_calls() - db_before:.0f}")
+    print(f"notifications:    {sent} ({sent / send_time if send_time else 0:.0f}/s) {dict(bot.calls)}")
+    print(f"poster hit rate:  {notifier.posters.hit_rate:.1%}")
+    print(f"heap peak:        {peak / 2 ** 20:.1f} MiB")
+
+    # Same shows again with nothing changed, every show answers 304
+    checker.synced_at = None
+    api_before, not_modified_before = sum(fake_tvmaze.calls.values()), fake_tvmaze.not_modified
+    started = time.perf_counter()
+    await checker.sweep()
+    print("== unchanged full sweep")
+    print(f"detection:        {time.perf_counter() - started:.2f}s")
+    print(f"TVMaze calls:     {sum(fake_tvmaze.calls.values()) - api_before}")
+    print(f"304 responses:    {fake_tvmaze.not_modified - not_modified_before}")
+
+
+async def bench_handler(name, users, make_call):
+    bot = FakeBot(latency=BOT_LATENCY)
+    db_before = db_calls()
+    latencies = []
+
+    async def one():
+        user_id = random.randint(1, users)
+        started = time.perf_counter()
+        await make_call(bot, user_id)
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(HANDLER_REQUESTS)))
+    print(f"== {name}")
+    print(f"requests:         {HANDLER_REQUESTS}")
+    print(f"p50 / p99:        {percentile(latencies, 50) * 1000:.1f} / {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"DB calls:         {db_calls() - db_before:.0f}")
+
+
+async def main():
+    if not BENCH_DATABASE_URL:
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway Postgres database")
+
+    fake_tvmaze = FakeTVMaze(SHOWS, latency=TVMAZE_LATENCY, rate_429=TVMAZE_429_RATE)
+    await fake_tvmaze.start()
+    db = Database(BENCH_DATABASE_URL)
+    await db.connect()
+    tvmaze = TVMazeClient(base_url=fake_tvmaze.url, db=db)
+    await tvmaze.start()
+
+    try:
+        started = time.perf_counter()
+        users, subs = await seed(db)
+        print(f"seeded {users} users / {subs} subscriptions / {SHOWS} shows in {time.perf_counter() - started:.1f}s")
+
+        await bench_sweep(db, tvmaze, fake_tvmaze)
+
+        async def calendar(bot, user_id):
+            await show_calendar(FakeMessage(bot, user_id), db)
+
+        async def add(bot, user_id):
+            query = f"show {random.randint(1, SHOWS)}"
+            await process_add_show(FakeMessage(bot, user_id, query), FakeState(), db, tvmaze)
+
+        await bench_handler('/calendar', users, calendar)
+        api_before = sum(fake_tvmaze.calls.values())
+        await bench_handler('/add', users, add)
+        print(f"TVMaze calls:     {sum(fake_tvmaze.calls.values()) - api_before}")
+        print(f"search hit rate:  {tvmaze.searches.hit_rate:.1%} memory, {tvmaze.search_db_hit_rate:.1%} db")
+
+        print(f"max RSS:          {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    finally:
+        await tvmaze.close()
+        await db.close()
+        await fake_tvmaze.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', 'bench')
+# The stub server has no rate limit, measure raw throughput
+os.environ.setdefault('TVMAZE_RATE_CALLS', '1000000')
+
+from api import TVMazeClient
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 2000))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 20))
+
+SHOW = {
+    'id': 1, 'name': 'Stub', 'url': 'http://stub/shows/1', 'premiered': '2020-01-01',
+    'image': {'medium': 'http://stub/1.jpg'},
+    '_embedded': {
+        'previousepisode': {'id': 10, 'season': 1, 'number': 1, 'name': 'Pilot', 'summary': '<p>Stub</p>'}
+    }
+}
+
+
+async def stub_show(request):
+    return web.json_response(SHOW)
+
+
+async def start_stub():
+    app = web.Application()
+    app.router.add_get('/shows/{show_id}', stub_show)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def session_per_call(base_url, show_id):
+    # Old behaviour: a fresh ClientSession (and TCP connection) for every call
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/shows/{show_id}?embed=previousepisode") as resp:
+            return await resp.json()
+
+
+async def run(name, fetch):
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with sem:
+            await fetch(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<20} {REQUESTS} req in {elapsed:.2f}s -> {REQUESTS / elapsed:.0f} req/s")
+
+
+async def main():
+    runner, base_url = await start_stub()
+    try:
+        await run("session per call", lambda i: session_per_call(base_url, i))
+
+        client = TVMazeClient(base_url=base_url)
+        await client.start()
+        try:
+            await run("shared session", client.get_latest_episode_with_info)
+        finally:
+            await client.close()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
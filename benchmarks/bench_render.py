@@ -0,0 +1,55 @@
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', 'bench')
+
+from render import NotificationRenderer, render_notification
+from fakes import show_payload
+
+SUBSCRIBERS = int(os.environ.get('BENCH_SUBSCRIBERS', 10000))
+
+EPISODE = dict(show_payload(1)['_embedded']['previousepisode'], show_year='2020')
+
+
+def render_uncached(show_name, ep):
+    # Previous behaviour: regex compiled on the fly and the caption rebuilt per subscriber
+    raw_summary = ep.get('summary', '')
+    clean_summary = ""
+    if raw_summary:
+        clean_summary = re.sub(r'<[^>]+>', '', raw_summary)
+        if len(clean_summary) > 200:
+            clean_summary = clean_summary[:200] + "..."
+
+    year = ep.get('show_year', '')
+    year_str = f" ({year})" if year else ""
+    return (
+        f"🔥 <b>New Episode!</b>\n"
+        f"🎬 Series: <b>{show_name}{year_str}</b>\n"
+        f"🔢 Season {ep.get('season')} - Episode{ep.get('number')}\n"
+        f"📝 <b>{ep.get('name')}</b>\n\n"
+        f"<i>{clean_summary}</i>"
+    )
+
+
+def fan_out(render):
+    for _ in range(SUBSCRIBERS):
+        render("Show 1", EPISODE)
+
+
+def main():
+    renderer = NotificationRenderer()
+    for name, render in (
+        ("per subscriber (old)", render_uncached),
+        ("per subscriber (new)", render_notification),
+        ("cached per episode", renderer.render),
+    ):
+        seconds = min(timeit.repeat(lambda: fan_out(render), number=1, repeat=5))
+        print(f"{name:<22} {SUBSCRIBERS} renders in {seconds * 1000:.1f} ms "
+              f"({seconds / SUBSCRIBERS * 1e6:.2f} µs each)")
+
+
+if __name__ == "__main__":
+    main()
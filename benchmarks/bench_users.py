@@ -0,0 +1,124 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Burst load test for user writes: a spike of /start and /add, first the old
+# way (upsert_user on every /start, upsert + INSERT per /add), then through
+# ProfileBuffer and the single-statement add_subscription. A probe keeps
+# acquiring pool connections during the burst to show how long any other
+# query would have waited for one.
+#
+#   BENCH_DATABASE_URL=postgresql://localhost/pekseries_bench python benchmarks/bench_users.py
+#
+# users and subscriptions in BENCH_DATABASE_URL are truncated first, never point it at production.
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL')
+USERS = int(os.environ.get('BENCH_USERS', 2000))
+STARTS_PER_USER = int(os.environ.get('BENCH_STARTS_PER_USER', 3))
+ADDS_PER_USER = int(os.environ.get('BENCH_ADDS_PER_USER', 1))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 200))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', 'bench')
+
+from database import Database
+from profiles import ProfileBuffer
+
+UPSERT_USER = '''
+    INSERT INTO users (user_id, username, first_name, last_name)
+    VALUES ($1, $2, $3, $4) ON CONFLICT (user_id) DO
+    UPDATE SET username = $2, first_name = $3, last_name = $4
+'''
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def burst():
+    events = []
+    for user_id in range(1, USERS + 1):
+        events += [('start', user_id, None)] * STARTS_PER_USER
+        events += [('add', user_id, random.randint(1, 1000)) for _ in range(ADDS_PER_USER)]
+    random.shuffle(events)
+    return events
+
+
+async def legacy(db, profiles, kind, user_id, show_id):
+    await db.pool.execute(UPSERT_USER, user_id, f"user{user_id}", 'Bench', None)
+    if kind == 'add':
+        await db.pool.execute(
+            'INSERT INTO subscriptions (user_id, show_id, show_name, last_episode_id) '
+            'VALUES ($1, $2, $3, 0) ON CONFLICT DO NOTHING',
+            user_id, show_id, f"Show {show_id}"
+        )
+
+
+async def buffered(db, profiles, kind, user_id, show_id):
+    if kind == 'start':
+        profiles.put(user_id, f"user{user_id}", 'Bench', None)
+    else:
+        await db.add_subscription(user_id, show_id, f"Show {show_id}", f"user{user_id}", 'Bench', None)
+
+
+async def run(name, db, handle, events):
+    async with db.pool.acquire() as conn:
+        await conn.execute('TRUNCATE users, subscriptions')
+    profiles = ProfileBuffer(db)
+    await profiles.start()
+
+    waits = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            async with db.pool.acquire():
+                waits.append(time.perf_counter() - started)
+            await asyncio.sleep(0.001)
+
+    sem = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(event):
+        async with sem:
+            started = time.perf_counter()
+            await handle(db, profiles, *event)
+            latencies.append(time.perf_counter() - started)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(event) for event in events))
+    await profiles.close()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    users = await db.pool.fetchval('SELECT COUNT(*) FROM users')
+    print(f"== {name}")
+    print(f"events:           {len(events)} in {elapsed:.2f}s ({len(events) / elapsed:.0f}/s)")
+    print(f"handler p50/p99:  {percentile(latencies, 50) * 1000:.1f} / {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"pool wait mean:   {sum(waits) / len(waits) * 1000:.1f} ms over {len(waits)} probes")
+    print(f"pool wait p99:    {percentile(waits, 99) * 1000:.1f} ms")
+    print(f"users rows:       {users}")
+
+
+async def main():
+    if not BENCH_DATABASE_URL:
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway Postgres database")
+
+    db = Database(BENCH_DATABASE_URL)
+    await db.connect()
+    try:
+        events = burst()
+        await run('per-call upserts', db, legacy, events)
+        await run('write-behind + CTE add', db, buffered, events)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+
+# Replays updates against a running webhook replica and reports handler latency.
+#   python benchmarks/bench_webhook.py http://127.0.0.1:8080/webhook [updates.jsonl]
+# Without a file it sends synthetic /help messages from BENCH_CHAT_ID.
+# With handle_in_background off, the response only returns once the handler is done.
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 1000))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 40))
+CHAT_ID = int(os.environ.get('BENCH_CHAT_ID', 1))
+SECRET = os.environ.get('WEBHOOK_SECRET', '')
+
+
+def synthetic_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Bench'},
+            'text': '/help',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+        }
+    }
+
+
+def load_updates(path):
+    if not path:
+        return [synthetic_update(i) for i in range(REQUESTS)]
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main(url, path=None):
+    updates = load_updates(path)
+    latencies = []
+    statuses = {}
+    sem = asyncio.Semaphore(CONCURRENCY)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def send(update):
+            async with sem:
+                started = time.perf_counter()
+                async with session.post(url, json=update) as resp:
+                    await resp.read()
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"updates:    {len(updates)} in {elapsed:.2f}s ({len(updates) / elapsed:.0f}/s)")
+    print(f"statuses:   {statuses}")
+    print(f"p50:        {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"p99:        {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"mean:       {statistics.mean(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: bench_webhook.py URL [updates.jsonl]")
+    asyncio.run(main(*sys.argv[1:3]))
\ No newline at end of file
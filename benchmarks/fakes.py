@@ -0,0 +1,152 @@
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from aiohttp import web
+
+
+def episode_id(show_id):
+    return show_id * 1000 + 1
+
+
+def show_payload(show_id):
+    return {
+        'id': show_id,
+        'name': f"Show {show_id}",
+        'url': f"https://www.tvmaze.com/shows/{show_id}",
+        'premiered': '2020-01-01',
+        'status': 'Running',
+        'rating': {'average': 7.3},
+        'genres': ['Drama', 'Thriller'],
+        'updated': 1700000000 + show_id,
+        'weight': 100 - show_id % 100,
+        'image': {'medium': f"https://static.tvmaze.com/{show_id}.jpg"},
+        '_embedded': {
+            'previousepisode': {
+                'id': episode_id(show_id), 'season': 1, 'number': 1, 'name': 'Pilot',
+                'airdate': '2024-01-01', 'airstamp': '2024-01-01T02:00:00+00:00',
+                'summary': '<p>Someone does <b>something</b> &amp; it goes wrong.</p>' * 3
+            },
+            'nextepisode': {
+                'id': episode_id(show_id) + 1, 'season': 1, 'number': 2, 'name': 'Second',
+                'airdate': '2099-01-01', 'airstamp': '2099-01-01T02:00:00+00:00', 'summary': None
+            }
+        }
+    }
+
+
+class FakeTVMaze:
+    # Local stand-in for api.tvmaze.com with configurable latency and 429 injection
+    def __init__(self, shows, latency=0.0, rate_429=0.0):
+        self.shows = shows
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.calls = Counter()
+        self.not_modified = 0
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/shows/{show_id}', self.handle_show)
+        app.router.add_get('/shows', self.handle_index)
+        app.router.add_get('/search/shows', self.handle_search)
+        app.router.add_get('/updates/shows', self.handle_updates)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def close(self):
+        await self.runner.cleanup()
+
+    async def _respond(self, endpoint, body, request=None, etag=None):
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_429 and random.random() < self.rate_429:
+            self.calls['429'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        if body is None:
+            return web.Response(status=404)
+        if etag and request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.json_response(body, headers={'ETag': etag} if etag else None)
+
+    async def handle_show(self, request):
+        show_id = int(request.match_info['show_id'])
+        body = show_payload(show_id) if 1 <= show_id <= self.shows else None
+        etag = f'W/"{show_id}-{body["updated"]}"' if body else None
+        return await self._respond('show', body, request, etag)
+
+    async def handle_index(self, request):
+        return await self._respond('index', None)
+
+    async def handle_search(self, request):
+        match = re.search(r'\d+', request.query.get('q', ''))
+        show_id = int(match.group()) if match else 0
+        body = [{'score': 1, 'show': show_payload(show_id)}] if 1 <= show_id <= self.shows else []
+        return await self._respond('search', body)
+
+    async def handle_updates(self, request):
+        body = {str(show_id): 1700000000 + show_id for show_id in range(1, self.shows + 1)}
+        return await self._respond('updates', body)
+
+
+class FakeBot:
+    # Records sends instead of talking to Telegram
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.started = None
+        self.finished = None
+
+    async def _call(self, method):
+        if self.started is None:
+            self.started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        self.finished = time.perf_counter()
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self._call('send_photo')
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"file-{photo}")])
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        await self._call('send_media_group')
+        return [SimpleNamespace(photo=[SimpleNamespace(file_id=f"file-{item.media}")]) for item in media]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call('send_message')
+        return FakeMessage(self, chat_id, text)
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        await self._call('send_chat_action')
+
+
+class FakeMessage:
+    def __init__(self, bot, chat_id, text=''):
+        self.bot = bot
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=chat_id, username=None, first_name='Bench', last_name=None)
+        self.text = text
+
+    async def answer(self, text, **kwargs):
+        await self.bot._call('send_message')
+        return FakeMessage(self.bot, self.chat.id, text)
+
+    async def edit_text(self, text, **kwargs):
+        await self.bot._call('edit_message_text')
+        self.text = text
+        return self
+
+
+class FakeState:
+    async def clear(self):
+        pass
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+
+class AsyncTTLCache:
+    # LRU cache with expiry in front of an async loader. Concurrent misses for
+    # the same key share one load, and entries close to expiry are refreshed
+    # in the background while the old value is still served.
+    def __init__(self, loader, ttl, negative_ttl=None, maxsize=10000, refresh_ahead=0.2):
+        self.loader = loader
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.maxsize = maxsize
+        self.refresh_ahead = refresh_ahead
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry:
+            value, ttl, expires_at = entry
+            remaining = expires_at - time.monotonic()
+            if remaining > 0:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                if remaining < ttl * self.refresh_ahead and key not in self.pending:
+                    self._load(key)
+                return value
+
+        self.misses += 1
+        task = self.pending.get(key) or self._load(key)
+        return await asyncio.shield(task)
+
+    def set(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self.entries[key] = (value, ttl, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _load(self, key):
+        task = asyncio.create_task(self._fetch(key))
+        self.pending[key] = task
+        task.add_done_callback(lambda _: self._loaded(key, task))
+        return task
+
+    def _loaded(self, key, task):
+        self.pending.pop(key, None)
+        # A failed load isn't cached; a background refresh has nobody awaiting it, so log it here
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Cache load failed for {key!r}: {task.exception()}")
+
+    async def _fetch(self, key):
+        value = await self.loader(key)
+        self.set(key, value)
+        return value
+
+class ResponseCache:
+    # Validators (ETag / Last-Modified) and decoded bodies of HTTP responses.
+    # A 304 hands back the object decoded the first time, so an unchanged
+    # response costs neither the body transfer nor a JSON parse. Entries are
+    # mirrored to the http_cache table so a restart still revalidates.
+    def __init__(self, db=None, maxsize=10000):
+        self.db = db
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        if not self.db:
+            return
+        # Evictions delete their rows as they happen, this catches a smaller maxsize
+        await self.db.prune_http_cache(self.maxsize)
+        for row in await self.db.get_http_responses(self.maxsize):
+            self.entries[row['url']] = (row['etag'], row['last_modified'], json.loads(row['body']))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry:
+            self.entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    async def store(self, key, etag, last_modified, data):
+        if not etag and not last_modified:
+            return
+        self.entries[key] = (etag, last_modified, data)
+        self.entries.move_to_end(key)
+        evicted = []
+        while len(self.entries) > self.maxsize:
+            evicted.append(self.entries.popitem(last=False)[0])
+        if self.db:
+            await self.db.set_http_response(key, etag, last_modified, json.dumps(data), evicted)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
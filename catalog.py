@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from config import CATALOG_PAGE_SIZE, CATALOG_REFRESH_INTERVAL, CATALOG_FULL_REFRESH_INTERVAL
+
+
+class CatalogSync:
+    def __init__(self, db, tvmaze):
+        self.db = db
+        self.tvmaze = tvmaze
+
+    async def start(self):
+        if not self.db.has_trgm:
+            return
+
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.error(f"⚠️ Catalog sync error: {e}")
+            await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+
+    async def sync(self):
+        # New shows only show up on the last pages of the index, so usually we
+        # resume from there. A full pass now and then picks up renames, its
+        # time is kept in the DB so restarts don't keep putting it off.
+        full = not await self.db.is_synced('catalog_full', CATALOG_FULL_REFRESH_INTERVAL)
+        page = 0 if full else await self.db.get_catalog_max_id() // CATALOG_PAGE_SIZE
+        full = page == 0
+
+        imported = 0
+        while True:
+            shows = await self.tvmaze.get_shows_page(page)
+            if not shows:
+                break
+            await self.db.upsert_catalog(shows)
+            # Index pages carry full show objects, keep their metadata too
+            await self.db.upsert_shows(shows)
+            imported += len(shows)
+            page += 1
+
+        # Only a pass that started at page 0 and got to the end counts as full
+        if full:
+            await self.db.set_synced('catalog_full')
+        logging.info(f"📚 Catalog synced: {imported} shows up to page {page}")
@@ -9,5 +9,89 @@ ADMIN_ID = int(admin_env) if admin_env else None
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Webhook mode is used when WEBHOOK_URL is set (e.g. https://bot.example.com), long polling otherwise
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+WEBAPP_HOST = os.environ.get('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.environ.get('PORT', 8080))
+WEBHOOK_MAX_IN_FLIGHT = int(os.environ.get('WEBHOOK_MAX_IN_FLIGHT', 40))
+
+# Prometheus /metrics endpoint, METRICS_PORT=0 disables it
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9108))
+
+# Replicas elect one scheduler per shard; shows are split by show_id % SHARD_COUNT
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+if not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise ValueError("BAD_SHARD_INDEX_ERROR")
+
+SCHEDULER_LOCK_ID = 72610000
+CATALOG_LOCK_ID = 72619999
+LEADER_RETRY_INTERVAL = 15
+LEADER_HEARTBEAT_INTERVAL = 10
+
 TVMAZE_URL = "https://api.tvmaze.com"
-CHECK_INTERVAL = 60 * 15
\ No newline at end of file
+CHECK_INTERVAL = 60 * 15
+
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
+HTTP_TIMEOUT = 15
+HTTP_CONNECT_TIMEOUT = 5
+# Conditional requests (ETag / Last-Modified) for these endpoints, the rest are
+# either cached higher up or change on every call
+HTTP_CACHE_ENDPOINTS = ('shows', 'search')
+HTTP_CACHE_SIZE = int(os.environ.get('HTTP_CACHE_SIZE', 5000))
+
+# TVMaze allows roughly 20 calls per 10 seconds per IP
+TVMAZE_RATE_CALLS = int(os.environ.get('TVMAZE_RATE_CALLS', 20))
+TVMAZE_RATE_PERIOD = 10
+TVMAZE_MAX_RETRIES = 3
+SWEEP_CONCURRENCY = int(os.environ.get('SWEEP_CONCURRENCY', 8))
+
+# /add search results: in-process LRU in front of the search_cache table
+SEARCH_CACHE_SIZE = 1000
+SEARCH_MEMORY_TTL = 60 * 60
+SEARCH_CACHE_TTL = 60 * 60 * 24 * 7
+SEARCH_NEGATIVE_TTL = 60 * 30
+SEARCH_WARMUP_SIZE = 500
+
+# users rows are written behind in batches; an unchanged profile is skipped
+# until PROFILE_TTL has passed, in case the row was deleted meanwhile
+PROFILE_FLUSH_INTERVAL = 5
+PROFILE_TTL = 60 * 60
+
+# Subscriptions per /list page, each one is a delete button
+LIST_PAGE_SIZE = 10
+
+# Local copy of TVMaze's show index used for /add and inline search
+CATALOG_PAGE_SIZE = 250
+CATALOG_REFRESH_INTERVAL = 60 * 60 * 24
+CATALOG_FULL_REFRESH_INTERVAL = 60 * 60 * 24 * 30
+# /add takes the best catalog match only above this score and this far ahead
+# of the runner-up, anything less certain is left to TVMaze's search
+CATALOG_MATCH_SCORE = 0.5
+CATALOG_MATCH_MARGIN = 0.1
+
+# /updates/shows?since=day only covers 24h, anything older needs a full sweep
+FULL_SWEEP_INTERVAL = 60 * 60 * 24
+OUTBOX_PAGE_SIZE = 500
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETENTION = 60 * 60 * 24 * 30
+RENDER_CACHE_SIZE = 1024
+
+# Telegram allows ~30 messages per second overall and ~1 per second per chat,
+# the global budget is split between shards
+DELIVERY_RATE = float(os.environ.get('DELIVERY_RATE', 30)) / SHARD_COUNT
+DELIVERY_CHAT_INTERVAL = float(os.environ.get('DELIVERY_CHAT_INTERVAL', 1.0))
+DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', 10))
+DELIVERY_QUEUE_SIZE = 1000
+DELIVERY_MAX_RETRIES = 3
+DELIVERY_ACK_INTERVAL = 2
+
+# Digest mode sends each user one message per cycle with all their new episodes,
+# or waits DIGEST_WINDOW seconds after the first one to collect the rest
+DIGEST_MODE = os.environ.get('DIGEST_MODE', '').lower() in ('1', 'true', 'yes')
+DIGEST_WINDOW = int(os.environ.get('DIGEST_WINDOW', 0))
+# Telegram albums take 2 to 10 photos
+DIGEST_ALBUM_SIZE = 10
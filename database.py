@@ -1,11 +1,16 @@
 import asyncpg
+import json
 import logging
+from datetime import date, datetime
+from metrics import DB_SECONDS, timed_methods
 
 
+@timed_methods(DB_SECONDS, exclude=('connect', 'close'))
 class Database:
     def __init__(self, dsn):
         self.dsn = dsn
         self.pool = None
+        self.has_trgm = False
 
     async def connect(self):
         try:
@@ -22,6 +27,11 @@ class Database:
             logging.error(f"❌ DATABASE_CONNECTION_ERROR: {e}")
             raise e
 
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
     async def _init_db(self):
         async with self.pool.acquire() as conn:
             await conn.execute('''
@@ -68,52 +78,602 @@ class Database:
                                    )
                                ''')
 
-    async def upsert_user(self, user_id, username, first_name, last_name):
-        sql = '''
-              INSERT INTO users (user_id, username, first_name, last_name)
-              VALUES ($1, $2, $3, $4) ON CONFLICT (user_id) DO \
-              UPDATE \
-                  SET username = $2, first_name = $3, last_name = $4 \
-              '''
-        try:
-            await self.pool.execute(sql, user_id, username, first_name, last_name)
-        except Exception as e:
-            logging.error(f"Error upserting user: {e}")
+            await conn.execute('''
+                               CREATE INDEX IF NOT EXISTS idx_subscriptions_show_user
+                                   ON subscriptions (show_id, user_id) INCLUDE (last_episode_id)
+                               ''')
 
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS show_updates
+                               (
+                                   show_id    BIGINT PRIMARY KEY,
+                                   updated_at BIGINT NOT NULL
+                               )
+                               ''')
+            await conn.execute('''
+                               ALTER TABLE show_updates ADD COLUMN IF NOT EXISTS episode_id BIGINT
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS upcoming_episodes
+                               (
+                                   show_id    BIGINT PRIMARY KEY,
+                                   episode_id BIGINT NOT NULL,
+                                   season     INT,
+                                   number     INT,
+                                   airdate    DATE,
+                                   airstamp   TIMESTAMPTZ
+                               )
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS shows
+                               (
+                                   show_id   BIGINT PRIMARY KEY,
+                                   name      TEXT NOT NULL,
+                                   url       TEXT,
+                                   premiered DATE,
+                                   status    TEXT,
+                                   rating    DOUBLE PRECISION,
+                                   genres    TEXT[],
+                                   image_url TEXT,
+                                   updated   BIGINT
+                               )
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS search_cache
+                               (
+                                   query     TEXT PRIMARY KEY,
+                                   show_id   BIGINT,
+                                   name      TEXT,
+                                   url       TEXT,
+                                   hits      INT         DEFAULT 0,
+                                   cached_at TIMESTAMPTZ DEFAULT NOW()
+                               )
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS catalog
+                               (
+                                   show_id   BIGINT PRIMARY KEY,
+                                   name      TEXT NOT NULL,
+                                   url       TEXT,
+                                   premiered DATE,
+                                   weight    INT DEFAULT 0
+                               )
+                               ''')
+            # Completion time of periodic jobs that have to survive restarts
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS sync_state
+                               (
+                                   name      TEXT PRIMARY KEY,
+                                   synced_at TIMESTAMPTZ NOT NULL
+                               )
+                               ''')
+            try:
+                await conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                await conn.execute('''
+                                   CREATE INDEX IF NOT EXISTS idx_catalog_name_trgm
+                                       ON catalog USING gin (lower(name) gin_trgm_ops)
+                                   ''')
+                self.has_trgm = True
+            except asyncpg.PostgresError as e:
+                logging.warning(f"pg_trgm unavailable, local catalog search disabled: {e}")
+
+            # Notification outbox: one row per (user, episode), drained by the scheduler
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS episodes
+                               (
+                                   episode_id BIGINT PRIMARY KEY,
+                                   show_id    BIGINT NOT NULL,
+                                   data       JSONB  NOT NULL
+                               )
+                               ''')
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS outbox
+                               (
+                                   id         BIGSERIAL PRIMARY KEY,
+                                   user_id    BIGINT NOT NULL,
+                                   show_id    BIGINT NOT NULL,
+                                   episode_id BIGINT NOT NULL,
+                                   attempts   INT         DEFAULT 0,
+                                   created_at TIMESTAMPTZ DEFAULT NOW(),
+                                   sent_at    TIMESTAMPTZ,
+                                   UNIQUE (user_id, show_id, episode_id)
+                               )
+                               ''')
+            await conn.execute('''
+                               CREATE INDEX IF NOT EXISTS idx_outbox_pending
+                                   ON outbox (id) WHERE sent_at IS NULL
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS http_cache
+                               (
+                                   url           TEXT PRIMARY KEY,
+                                   etag          TEXT,
+                                   last_modified TEXT,
+                                   body          JSONB NOT NULL,
+                                   stored_at     TIMESTAMPTZ DEFAULT NOW()
+                               )
+                               ''')
+
+            await conn.execute('''
+                               CREATE TABLE IF NOT EXISTS posters
+                               (
+                                   show_id   BIGINT PRIMARY KEY,
+                                   image_url TEXT NOT NULL,
+                                   file_id   TEXT NOT NULL
+                               )
+                               ''')
+
+    async def upsert_users(self, users):
+        # users: [(user_id, username, first_name, last_name), ...] from ProfileBuffer
+        await self.pool.executemany(
+            '''
+            INSERT INTO users (user_id, username, first_name, last_name)
+            VALUES ($1, $2, $3, $4) ON CONFLICT (user_id) DO
+            UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name
+            WHERE (users.username, users.first_name, users.last_name)
+                      IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name)
+            ''',
+            users
+        )
 
     async def add_subscription(self, user_id, show_id, show_name, username, first_name, last_name):
-        await self.upsert_user(user_id, username, first_name, last_name)
+        # User upsert and subscription insert in one statement and round trip
+        added = await self.pool.fetchval(
+            '''
+            WITH profile AS (
+                INSERT INTO users (user_id, username, first_name, last_name)
+                VALUES ($1, $4, $5, $6) ON CONFLICT (user_id) DO
+                UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name
+                WHERE (users.username, users.first_name, users.last_name)
+                          IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name)
+            )
+            INSERT INTO subscriptions (user_id, show_id, show_name, last_episode_id)
+            VALUES ($1, $2, $3, 0) ON CONFLICT (user_id, show_id) DO NOTHING
+            RETURNING TRUE
+            ''',
+            user_id, show_id, show_name, username, first_name, last_name
+        )
+        return bool(added)
 
-        try:
-            await self.pool.execute(
-                'INSERT INTO subscriptions (user_id, show_id, show_name, last_episode_id) VALUES ($1, $2, $3, 0)',
-                user_id, show_id, show_name
+    async def get_subscriptions_page(self, user_id, after_show_id, limit):
+        # Keyset pagination on the UNIQUE (user_id, show_id) index
+        return await self.pool.fetch(
+            '''
+            SELECT show_id, show_name FROM subscriptions
+            WHERE user_id = $1 AND show_id > $2
+            ORDER BY show_id
+            LIMIT $3
+            ''',
+            user_id, after_show_id, limit
+        )
+
+    async def get_previous_page_start(self, user_id, after_show_id, limit):
+        # The `after_show_id` of the page before the one starting after `after_show_id`
+        start = await self.pool.fetchval(
+            '''
+            SELECT show_id FROM subscriptions
+            WHERE user_id = $1 AND show_id <= $2
+            ORDER BY show_id DESC
+            OFFSET $3 LIMIT 1
+            ''',
+            user_id, after_show_id, limit
+        )
+        return start or 0
+
+    async def get_subscribed_shows(self, shard_count=1, shard_index=0):
+        # due: someone hasn't received the latest episode we know of yet, or
+        # the next episode has aired since the last poll. A show with no
+        # episode aired yet has nothing to receive.
+        rows = await self.pool.fetch(
+            '''
+            SELECT s.show_id,
+                   bool_or(u.episode_id IS NOT NULL AND s.last_episode_id IS DISTINCT FROM u.episode_id)
+                       OR bool_or(e.airstamp <= NOW()) IS TRUE AS due
+            FROM subscriptions s
+                     LEFT JOIN show_updates u ON u.show_id = s.show_id
+                     LEFT JOIN upcoming_episodes e ON e.show_id = s.show_id
+            WHERE s.show_id % $1 = $2
+            GROUP BY s.show_id
+            ''',
+            shard_count, shard_index
+        )
+        return {row['show_id']: row['due'] for row in rows}
+
+    async def save_episode(self, show_id, ep):
+        await self.pool.execute(
+            '''
+            INSERT INTO episodes (episode_id, show_id, data)
+            VALUES ($1, $2, $3::jsonb) ON CONFLICT (episode_id) DO
+            UPDATE SET data = EXCLUDED.data
+            ''',
+            ep['id'], show_id, json.dumps(ep)
+        )
+
+    async def get_episode(self, episode_id):
+        data = await self.pool.fetchval('SELECT data FROM episodes WHERE episode_id = $1', episode_id)
+        return json.loads(data) if data else None
+
+    async def enqueue_outbox(self, show_id, episode_id):
+        # The unique key makes re-detecting the same episode a no-op
+        result = await self.pool.execute(
+            '''
+            INSERT INTO outbox (user_id, show_id, episode_id)
+            SELECT user_id, show_id, $2
+            FROM subscriptions
+            WHERE show_id = $1 AND last_episode_id <> $2
+            ON CONFLICT (user_id, show_id, episode_id) DO NOTHING
+            ''',
+            show_id, episode_id
+        )
+        return int(result.split()[-1])
+
+    async def get_outbox_page(self, after_id, limit, max_attempts, shard_count=1, shard_index=0):
+        # Rows of users who unsubscribed meanwhile are skipped by the join
+        return await self.pool.fetch(
+            '''
+            SELECT o.id, o.user_id, o.show_id, o.episode_id, s.show_name
+            FROM outbox o
+                     JOIN subscriptions s ON s.user_id = o.user_id AND s.show_id = o.show_id
+            WHERE o.sent_at IS NULL
+              AND o.id > $1
+              AND o.attempts < $3
+              AND o.show_id % $4 = $5
+            ORDER BY o.id
+            LIMIT $2
+            ''',
+            after_id, limit, max_attempts, shard_count, shard_index
+        )
+
+    async def get_outbox_digest_page(self, after_user_id, limit, max_attempts, window, shard_count=1, shard_index=0):
+        # Every pending row of the next `limit` users whose oldest pending
+        # episode has waited at least `window` seconds, grouped by user. Rows
+        # without a subscription are left out of `ready` as well, a page of
+        # users with nothing to send would read as the end of the drain.
+        return await self.pool.fetch(
+            '''
+            WITH ready AS (
+                SELECT o.user_id
+                FROM outbox o
+                         JOIN subscriptions s ON s.user_id = o.user_id AND s.show_id = o.show_id
+                WHERE o.sent_at IS NULL
+                  AND o.user_id > $1
+                  AND o.attempts < $3
+                  AND o.show_id % $5 = $6
+                GROUP BY o.user_id
+                HAVING MIN(o.created_at) <= NOW() - make_interval(secs => $4::float8)
+                ORDER BY o.user_id
+                LIMIT $2
             )
-            return True
-        except asyncpg.UniqueViolationError:
-            return False
+            SELECT o.id, o.user_id, o.show_id, o.episode_id, o.attempts, s.show_name
+            FROM ready r
+                     JOIN outbox o ON o.user_id = r.user_id
+                     JOIN subscriptions s ON s.user_id = o.user_id AND s.show_id = o.show_id
+            WHERE o.sent_at IS NULL
+              AND o.attempts < $3
+              AND o.show_id % $5 = $6
+            ORDER BY o.user_id, o.id
+            ''',
+            after_user_id, limit, max_attempts, window, shard_count, shard_index
+        )
 
-    async def get_user_subscriptions(self, user_id):
-        rows = await self.pool.fetch('SELECT show_name, show_id FROM subscriptions WHERE user_id = $1', user_id)
-        return rows
+    async def complete_deliveries(self, show_id, episode_id, user_ids):
+        if not user_ids:
+            return
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    '''
+                    UPDATE outbox SET sent_at = NOW()
+                    WHERE show_id = $1 AND episode_id = $2 AND user_id = ANY($3::bigint[])
+                    ''',
+                    show_id, episode_id, list(user_ids)
+                )
+                await conn.execute(
+                    '''
+                    UPDATE subscriptions SET last_episode_id = $2
+                    WHERE show_id = $1 AND user_id = ANY($3::bigint[])
+                    ''',
+                    show_id, episode_id, list(user_ids)
+                )
+
+    async def record_delivery_failure(self, user_id, show_id, episode_id, max_attempts):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    '''
+                    UPDATE outbox SET attempts = attempts + 1
+                    WHERE user_id = $1 AND show_id = $2 AND episode_id = $3
+                    RETURNING attempts, created_at
+                    ''',
+                    user_id, show_id, episode_id
+                )
+                if row is not None and row['attempts'] >= max_attempts:
+                    # Abandoned: move the subscriber past it, or the show stays
+                    # due and gets polled on every sweep. Unless a newer episode
+                    # was delivered meanwhile, that would move them backwards.
+                    await conn.execute(
+                        '''
+                        UPDATE subscriptions s SET last_episode_id = $3
+                        WHERE s.user_id = $1 AND s.show_id = $2
+                          AND NOT EXISTS (
+                              SELECT 1 FROM outbox o
+                              WHERE o.user_id = $1 AND o.show_id = $2
+                                AND o.episode_id = s.last_episode_id
+                                AND o.sent_at IS NOT NULL
+                                AND o.created_at > $4
+                          )
+                        ''',
+                        user_id, show_id, episode_id, row['created_at']
+                    )
+
+    async def prune_outbox(self, max_age, max_attempts):
+        # Delivered rows, abandoned ones and ones whose subscription is gone
+        # (left by unsubscribes before delete_subscription cleared them), once
+        # they're older than max_age
+        await self.pool.execute(
+            '''
+            DELETE FROM outbox o
+            WHERE o.sent_at < NOW() - make_interval(secs => $1)
+               OR (o.sent_at IS NULL AND o.created_at < NOW() - make_interval(secs => $1)
+                   AND (o.attempts >= $2 OR NOT EXISTS (
+                       SELECT 1 FROM subscriptions s WHERE s.user_id = o.user_id AND s.show_id = o.show_id
+                   )))
+            ''',
+            float(max_age), max_attempts
+        )
+
+    async def delete_subscription(self, user_id, show_id):
+        # Name of the deleted show, None if there was no such subscription.
+        # Pending rows go too: the drain skips them, prune_outbox never
+        # matches them, and a resubscribe would send the stale episode.
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    'DELETE FROM outbox WHERE user_id = $1 AND show_id = $2 AND sent_at IS NULL',
+                    user_id, show_id
+                )
+                return await conn.fetchval(
+                    'DELETE FROM subscriptions WHERE user_id = $1 AND show_id = $2 RETURNING show_name',
+                    user_id, show_id
+                )
+
+    async def delete_user(self, user_id):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('DELETE FROM outbox WHERE user_id = $1 AND sent_at IS NULL', user_id)
+                await conn.execute('DELETE FROM subscriptions WHERE user_id = $1', user_id)
+                await conn.execute('DELETE FROM users WHERE user_id = $1', user_id)
+
+    async def get_show_update_times(self, show_ids):
+        rows = await self.pool.fetch(
+            'SELECT show_id, updated_at FROM show_updates WHERE show_id = ANY($1::bigint[])',
+            list(show_ids)
+        )
+        return {row['show_id']: row['updated_at'] for row in rows}
+
+    async def set_show_update_time(self, show_id, updated_at, episode_id):
+        await self.pool.execute(
+            '''
+            INSERT INTO show_updates (show_id, updated_at, episode_id)
+            VALUES ($1, $2, $3) ON CONFLICT (show_id) DO
+            UPDATE SET updated_at = EXCLUDED.updated_at, episode_id = EXCLUDED.episode_id
+            ''',
+            show_id, updated_at, episode_id
+        )
+
+    async def set_upcoming_episode(self, show_id, ep):
+        if not ep:
+            await self.pool.execute('DELETE FROM upcoming_episodes WHERE show_id = $1', show_id)
+            return
+
+        airdate = date.fromisoformat(ep['airdate']) if ep.get('airdate') else None
+        airstamp = datetime.fromisoformat(ep['airstamp']) if ep.get('airstamp') else None
+        await self.pool.execute(
+            '''
+            INSERT INTO upcoming_episodes (show_id, episode_id, season, number, airdate, airstamp)
+            VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (show_id) DO
+            UPDATE SET episode_id = EXCLUDED.episode_id, season = EXCLUDED.season, number = EXCLUDED.number,
+                airdate = EXCLUDED.airdate, airstamp = EXCLUDED.airstamp
+            ''',
+            show_id, ep['id'], ep.get('season'), ep.get('number'), airdate, airstamp
+        )
 
-    async def get_all_subscriptions(self):
-        rows = await self.pool.fetch('SELECT user_id, show_id, show_name, last_episode_id FROM subscriptions')
+    async def get_user_calendar(self, user_id):
+        rows = await self.pool.fetch(
+            '''
+            SELECT s.show_name, e.episode_id, e.season, e.number, e.airdate
+            FROM subscriptions s
+                     LEFT JOIN upcoming_episodes e ON e.show_id = s.show_id
+            WHERE s.user_id = $1
+            ORDER BY e.airdate NULLS LAST, s.show_name
+            ''',
+            user_id
+        )
         return rows
 
-    async def delete_subscription(self, user_id, show_name):
-        result = await self.pool.execute(
-            'DELETE FROM subscriptions WHERE user_id = $1 AND show_name = $2',
-            user_id, show_name
+    async def get_cached_search(self, query, ttl, negative_ttl):
+        # Not-found results (show_id IS NULL) expire after the shorter negative_ttl
+        return await self.pool.fetchrow(
+            '''
+            UPDATE search_cache
+            SET hits = hits + 1
+            WHERE query = $1
+              AND cached_at > NOW() - make_interval(secs => CASE WHEN show_id IS NULL THEN $3::float8 ELSE $2::float8 END)
+            RETURNING show_id, name, url
+            ''',
+            query, float(ttl), float(negative_ttl)
+        )
+
+    async def set_cached_search(self, query, result):
+        show_id, name, url = result or (None, None, None)
+        await self.pool.execute(
+            '''
+            INSERT INTO search_cache (query, show_id, name, url)
+            VALUES ($1, $2, $3, $4) ON CONFLICT (query) DO
+            UPDATE SET show_id = EXCLUDED.show_id, name = EXCLUDED.name, url = EXCLUDED.url, cached_at = NOW()
+            ''',
+            query, show_id, name, url
+        )
+
+    async def get_popular_searches(self, limit, ttl):
+        return await self.pool.fetch(
+            '''
+            SELECT query, show_id, name, url
+            FROM search_cache
+            WHERE show_id IS NOT NULL
+              AND cached_at > NOW() - make_interval(secs => $2)
+            ORDER BY hits DESC
+            LIMIT $1
+            ''',
+            limit, float(ttl)
+        )
+
+    async def is_synced(self, name, max_age):
+        # Whether the job last completed less than max_age seconds ago
+        return await self.pool.fetchval(
+            '''
+            SELECT EXISTS (
+                SELECT 1 FROM sync_state
+                WHERE name = $1 AND synced_at > NOW() - make_interval(secs => $2::float8)
+            )
+            ''',
+            name, float(max_age)
+        )
+
+    async def set_synced(self, name):
+        await self.pool.execute(
+            '''
+            INSERT INTO sync_state (name, synced_at) VALUES ($1, NOW())
+            ON CONFLICT (name) DO UPDATE SET synced_at = NOW()
+            ''',
+            name
+        )
+
+    async def get_catalog_max_id(self):
+        return await self.pool.fetchval('SELECT COALESCE(MAX(show_id), 0) FROM catalog')
+
+    async def upsert_catalog(self, shows):
+        await self.pool.executemany(
+            '''
+            INSERT INTO catalog (show_id, name, url, premiered, weight)
+            VALUES ($1, $2, $3, $4, $5) ON CONFLICT (show_id) DO
+            UPDATE SET name = EXCLUDED.name, url = EXCLUDED.url,
+                premiered = EXCLUDED.premiered, weight = EXCLUDED.weight
+            ''',
+            [
+                (
+                    show['id'], show['name'], show.get('url'),
+                    date.fromisoformat(show['premiered']) if show.get('premiered') else None,
+                    show.get('weight') or 0
+                )
+                for show in shows
+            ]
         )
-        return "DELETE 0" not in result
 
-    async def update_last_episode(self, user_id, show_id, episode_id):
+    async def search_catalog(self, query, limit, prefix_first=True):
+        # Trigram similarity, then TVMaze popularity. Autocomplete puts prefix
+        # matches first; /add must not, "bear" would pick "Bear Grylls" over "The Bear".
+        if not self.has_trgm:
+            return []
+        prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return await self.pool.fetch(
+            '''
+            SELECT show_id, name, url, premiered,
+                   lower(name) = $1 AS is_exact,
+                   similarity(lower(name), $1) AS score
+            FROM catalog
+            WHERE lower(name) % $1
+               OR lower(name) LIKE $2
+            ORDER BY ($4::bool AND lower(name) LIKE $2) DESC, score DESC, weight DESC
+            LIMIT $3
+            ''',
+            query, prefix, limit, prefix_first
+        )
+
+    async def get_catalog_show(self, show_id):
+        return await self.pool.fetchrow('SELECT show_id, name, url FROM catalog WHERE show_id = $1', show_id)
+
+    async def upsert_shows(self, shows):
+        # Rows whose TVMaze `updated` stamp didn't move are left alone
+        await self.pool.executemany(
+            '''
+            INSERT INTO shows (show_id, name, url, premiered, status, rating, genres, image_url, updated)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) ON CONFLICT (show_id) DO
+            UPDATE SET name = EXCLUDED.name, url = EXCLUDED.url, premiered = EXCLUDED.premiered,
+                status = EXCLUDED.status, rating = EXCLUDED.rating, genres = EXCLUDED.genres,
+                image_url = EXCLUDED.image_url, updated = EXCLUDED.updated
+            WHERE shows.updated IS DISTINCT FROM EXCLUDED.updated
+            ''',
+            [
+                (
+                    show['id'], show['name'], show.get('url'),
+                    date.fromisoformat(show['premiered']) if show.get('premiered') else None,
+                    show.get('status'),
+                    (show.get('rating') or {}).get('average'),
+                    show.get('genres') or [],
+                    (show.get('image') or {}).get('medium'),
+                    show.get('updated')
+                )
+                for show in shows
+            ]
+        )
+
+    async def get_show(self, show_id):
+        return await self.pool.fetchrow(
+            'SELECT show_id, name, url, premiered, status, rating, genres, image_url FROM shows WHERE show_id = $1',
+            show_id
+        )
+
+    async def get_http_responses(self, limit):
+        return await self.pool.fetch(
+            'SELECT url, etag, last_modified, body FROM http_cache ORDER BY stored_at DESC LIMIT $1',
+            limit
+        )
+
+    async def prune_http_cache(self, keep):
+        await self.pool.execute(
+            'DELETE FROM http_cache WHERE url NOT IN (SELECT url FROM http_cache ORDER BY stored_at DESC LIMIT $1)',
+            keep
+        )
+
+    async def set_http_response(self, url, etag, last_modified, body, evicted=()):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    '''
+                    INSERT INTO http_cache (url, etag, last_modified, body)
+                    VALUES ($1, $2, $3, $4::jsonb) ON CONFLICT (url) DO
+                    UPDATE SET etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified,
+                        body = EXCLUDED.body, stored_at = NOW()
+                    ''',
+                    url, etag, last_modified, body
+                )
+                if evicted:
+                    await conn.execute('DELETE FROM http_cache WHERE url = ANY($1::text[])', list(evicted))
+
+    async def get_posters(self):
+        rows = await self.pool.fetch('SELECT show_id, image_url, file_id FROM posters')
+        return {row['show_id']: (row['image_url'], row['file_id']) for row in rows}
+
+    async def set_poster(self, show_id, image_url, file_id):
         await self.pool.execute(
-            'UPDATE subscriptions SET last_episode_id = $1 WHERE user_id = $2 AND show_id = $3',
-            episode_id, user_id, show_id
+            '''
+            INSERT INTO posters (show_id, image_url, file_id)
+            VALUES ($1, $2, $3) ON CONFLICT (show_id) DO
+            UPDATE SET image_url = EXCLUDED.image_url, file_id = EXCLUDED.file_id
+            ''',
+            show_id, image_url, file_id
         )
 
+    async def delete_poster(self, show_id):
+        await self.pool.execute('DELETE FROM posters WHERE show_id = $1', show_id)
+
     async def get_stats(self):
         users_count = await self.pool.fetchval('SELECT COUNT(*) FROM users')
         subs_count = await self.pool.fetchval('SELECT COUNT(*) FROM subscriptions')
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import NamedTuple
+from aiogram.types import InputMediaPhoto
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+from config import (
+    DELIVERY_QUEUE_SIZE, DELIVERY_WORKERS, DELIVERY_RATE, DELIVERY_CHAT_INTERVAL,
+    DELIVERY_MAX_RETRIES, DELIVERY_ACK_INTERVAL, OUTBOX_MAX_ATTEMPTS
+)
+from metrics import NOTIFICATIONS_SENT, NOTIFICATION_ERRORS
+from ratelimit import RateLimiter
+
+# Telegram's errors for a file_id it no longer accepts
+STALE_FILE_ERRORS = ('wrong file identifier', 'file reference expired')
+
+
+class Notification(NamedTuple):
+    user_id: int
+    items: tuple  # ((show_id, episode_id), ...), more than one for a digest
+    text: str
+    photo: str | None = None
+    media: tuple | None = None  # ((show_id, image_url, caption), ...) to send as an album
+
+    @property
+    def show_id(self):
+        return self.items[0][0]
+
+    @property
+    def keys(self):
+        return [(self.user_id, show_id, episode_id) for show_id, episode_id in self.items]
+
+
+class PosterCache:
+    # Telegram file_id of each show's poster, so it's uploaded once per show
+    # instead of Telegram fetching the TVMaze URL for every subscriber.
+    def __init__(self, db):
+        self.db = db
+        self.entries = {}
+        self.locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        self.entries = await self.db.get_posters()
+
+    def get(self, show_id, image_url):
+        entry = self.entries.get(show_id)
+        if entry and entry[0] == image_url:
+            return entry[1]
+        return None
+
+    def lock(self, show_id):
+        return self.locks.setdefault(show_id, asyncio.Lock())
+
+    async def store(self, show_id, image_url, file_id):
+        self.entries[show_id] = (image_url, file_id)
+        self.locks.pop(show_id, None)
+        await self.db.set_poster(show_id, image_url, file_id)
+
+    async def invalidate(self, show_id):
+        self.entries.pop(show_id, None)
+        await self.db.delete_poster(show_id)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class NotificationQueue:
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self.queue = asyncio.Queue(maxsize=DELIVERY_QUEUE_SIZE)
+        self.limiter = RateLimiter(DELIVERY_RATE, 1)
+        self.posters = PosterCache(db)
+        self.chat_ready_at = {}
+        # Keys stay here from put() until the delivery is written to the DB,
+        # so a sweep that overlaps a pending ack can't enqueue a duplicate.
+        self.in_flight = set()
+        # Keys written since the outbox was last read. A drain may still hold
+        # a row read before its ack landed, these keep it from being resent.
+        self.recently_acked = set()
+        self.acks = defaultdict(list)
+        self.tasks = []
+
+    async def start(self):
+        await self.posters.load()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(DELIVERY_WORKERS)]
+        self.tasks.append(asyncio.create_task(self._ack_loop()))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await self._flush_acks()
+
+    async def put(self, user_id, show_id, episode_id, text, photo=None):
+        await self._enqueue(Notification(user_id, ((show_id, episode_id),), text, photo))
+
+    async def put_digest(self, user_id, items, text, media=None):
+        await self._enqueue(Notification(user_id, tuple(items), text, media=media))
+
+    def forget_acked(self):
+        # Call right before reading the outbox: every ack written so far is visible to that read
+        self.recently_acked.clear()
+
+    def discard_queued(self):
+        # Drops jobs no worker has picked up yet, for when this replica stops
+        # draining the outbox: the new leader sends them, we'd only duplicate.
+        # Sends already under way still finish and get acked.
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            self.in_flight.difference_update(job.keys)
+            self.queue.task_done()
+
+    async def _enqueue(self, job):
+        keys = job.keys
+        if any(key in self.in_flight or key in self.recently_acked for key in keys):
+            return
+        self.in_flight.update(keys)
+        try:
+            await self.queue.put(job)
+        except asyncio.CancelledError:
+            self.in_flight.difference_update(keys)
+            raise
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if not await self._deliver(job):
+                    self.in_flight.difference_update(job.keys)
+            except Exception as e:
+                logging.error(f"Delivery error {job.user_id}: {e}")
+                self.in_flight.difference_update(job.keys)
+            finally:
+                self.queue.task_done()
+
+    def _ack(self, job):
+        for show_id, episode_id in job.items:
+            self.acks[show_id, episode_id].append(job.user_id)
+
+    async def _deliver(self, job):
+        for attempt in range(DELIVERY_MAX_RETRIES + 1):
+            await self._pace(job.user_id)
+            try:
+                await self._send(job)
+                NOTIFICATIONS_SENT.inc()
+                self._ack(job)
+                return True
+            except TelegramRetryAfter as e:
+                NOTIFICATION_ERRORS.labels('retry_after').inc()
+                logging.warning(f"Flood control on {job.user_id}, retry in {e.retry_after}s")
+                self.limiter.backoff(e.retry_after)
+            except TelegramForbiddenError:
+                NOTIFICATION_ERRORS.labels('blocked').inc()
+                logging.info(f"🚫 User {job.user_id} blocked the bot, removing")
+                await self.db.delete_user(job.user_id)
+                return False
+            except TelegramBadRequest as e:
+                NOTIFICATION_ERRORS.labels('bad_request').inc()
+                if job.photo or job.media:
+                    # Telegram couldn't use the poster(s), send the text alone
+                    logging.warning(f"Photo rejected for {job.user_id}: {e}")
+                    job = job._replace(photo=None, media=None)
+                    continue
+                if len(job.items) > 1 and 'too long' in e.message:
+                    # Count it against the rows instead of acking them: the
+                    # drain sends episodes with failed attempts one by one
+                    logging.error(f"Digest for {job.user_id} rejected: {e}")
+                    break
+                # Retrying won't help, don't keep resending it every sweep
+                logging.error(f"Send error {job.user_id}: {e}")
+                self._ack(job)
+                return True
+            except (TelegramNetworkError, TelegramServerError) as e:
+                NOTIFICATION_ERRORS.labels('network').inc()
+                logging.warning(f"Send error {job.user_id}, attempt {attempt + 1}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                # TelegramNotFound, undecodable responses, ...: count it against
+                # the outbox row's attempts so it isn't resent on every drain
+                NOTIFICATION_ERRORS.labels('other').inc()
+                logging.error(f"Send error {job.user_id}: {e}")
+                break
+
+        logging.error(f"Giving up on {job.user_id} for episodes {[episode_id for _, episode_id in job.items]}")
+        for show_id, episode_id in job.items:
+            await self.db.record_delivery_failure(job.user_id, show_id, episode_id, OUTBOX_MAX_ATTEMPTS)
+        return False
+
+    async def _send(self, job):
+        if job.media:
+            await self._send_album(job)
+            return
+        if not job.photo:
+            await self.bot.send_message(job.user_id, job.text, parse_mode="HTML")
+            return
+
+        file_id = self.posters.get(job.show_id, job.photo)
+        if file_id:
+            try:
+                await self.bot.send_photo(job.user_id, photo=file_id, caption=job.text, parse_mode="HTML")
+                self.posters.hits += 1
+                return
+            except TelegramBadRequest as e:
+                # Only a dead file_id is the poster's fault, anything else
+                # (a bad caption, a chat that's gone) is left to _deliver
+                if not any(reason in e.message.lower() for reason in STALE_FILE_ERRORS):
+                    raise
+                logging.warning(f"Cached poster for show {job.show_id} rejected: {e}")
+                await self.posters.invalidate(job.show_id)
+
+        # Only one worker uploads a given poster, the others wait and reuse it
+        async with self.posters.lock(job.show_id):
+            file_id = self.posters.get(job.show_id, job.photo)
+            if not file_id:
+                self.posters.misses += 1
+                message = await self.bot.send_photo(job.user_id, photo=job.photo, caption=job.text, parse_mode="HTML")
+                await self.posters.store(job.show_id, job.photo, message.photo[-1].file_id)
+                return
+
+        await self.bot.send_photo(job.user_id, photo=file_id, caption=job.text, parse_mode="HTML")
+        self.posters.hits += 1
+
+    async def _send_album(self, job):
+        # One call for the whole digest, posters already on Telegram are reused by file_id
+        media = []
+        for show_id, image_url, caption in job.media:
+            file_id = self.posters.get(show_id, image_url)
+            if file_id:
+                self.posters.hits += 1
+            else:
+                self.posters.misses += 1
+            media.append(InputMediaPhoto(media=file_id or image_url, caption=caption, parse_mode="HTML"))
+
+        messages = await self.bot.send_media_group(job.user_id, media=media)
+        for (show_id, image_url, _), message in zip(job.media, messages):
+            if not self.posters.get(show_id, image_url) and message.photo:
+                await self.posters.store(show_id, image_url, message.photo[-1].file_id)
+
+    async def _pace(self, chat_id):
+        now = time.monotonic()
+        if len(self.chat_ready_at) > 10000:
+            self.chat_ready_at = {k: v for k, v in self.chat_ready_at.items() if v > now}
+
+        ready_at = max(now, self.chat_ready_at.get(chat_id, 0))
+        self.chat_ready_at[chat_id] = ready_at + DELIVERY_CHAT_INTERVAL
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+        await self.limiter.acquire()
+
+    async def _ack_loop(self):
+        while True:
+            await asyncio.sleep(DELIVERY_ACK_INTERVAL)
+            await self._flush_acks()
+
+    async def _flush_acks(self):
+        # A key leaves self.acks only once it's written, so a flush cancelled
+        # by close() leaves the rest for the final flush instead of losing it
+        for key in list(self.acks):
+            user_ids = self.acks.pop(key)
+            try:
+                await self.db.complete_deliveries(*key, user_ids)
+            except Exception as e:
+                logging.error(f"Ack flush error: {e}")
+                # Keep the rest for the next flush
+                self.acks[key].extend(user_ids)
+                return
+            except asyncio.CancelledError:
+                self.acks[key].extend(user_ids)
+                raise
+
+            show_id, episode_id = key
+            for user_id in user_ids:
+                self.recently_acked.add((user_id, show_id, episode_id))
+                self.in_flight.discard((user_id, show_id, episode_id))
@@ -2,11 +2,14 @@ import html
 import logging
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import (
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery,
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ChatAction
-from api import TVMazeClient
-from config import ADMIN_ID
+from api import normalize_query
+from config import ADMIN_ID, LIST_PAGE_SIZE
 from states import AddShow
 
 router = Router()
@@ -22,12 +25,12 @@ def get_main_keyboard():
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, db):
+async def cmd_start(message: Message, profiles):
     await message.answer(
         "👋 Hi! I'm checking releases of new episodes for you.\nChoose action:",
         reply_markup=get_main_keyboard()
     )
-    await db.upsert_user(message.from_user.id, message.from_user.username, message.from_user.first_name, message.from_user.last_name)
+    profiles.put(message.from_user.id, message.from_user.username, message.from_user.first_name, message.from_user.last_name)
 
 
 @router.message(Command("admin"))
@@ -64,14 +67,14 @@ async def cb_add_start(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(AddShow.waiting_for_title)
-async def process_add_show(message: Message, state: FSMContext, db):
+async def process_add_show(message: Message, state: FSMContext, db, tvmaze):
     await message.bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
 
     query = message.text
     msg = await message.answer(f"🔍 Searching «{html.escape(query)}»...")
 
     try:
-        sid, name, url = await TVMazeClient.search_show(query)
+        sid, name, url = await tvmaze.search_show(query)
 
         if not sid:
             await msg.edit_text("❌ Couldn't find it. Try a different name.", reply_markup=get_main_keyboard())
@@ -89,7 +92,7 @@ async def process_add_show(message: Message, state: FSMContext, db):
 
         if is_added:
             try:
-                details = await TVMazeClient.get_show_details(sid)
+                details = await tvmaze.get_show_details(sid)
             except Exception as e:
                 logging.error(f"Error fetching details: {e}")
                 details = None
@@ -126,6 +129,53 @@ async def process_add_show(message: Message, state: FSMContext, db):
 
 
 
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery, db):
+    query = normalize_query(inline_query.query)
+    if len(query) < 2:
+        await inline_query.answer([], cache_time=60)
+        return
+
+    results = []
+    for show in await db.search_catalog(query, 20):
+        year = f" ({show['premiered'].year})" if show['premiered'] else ""
+        results.append(InlineQueryResultArticle(
+            id=str(show['show_id']),
+            title=f"{show['name']}{year}",
+            url=show['url'],
+            input_message_content=InputTextMessageContent(
+                message_text=f"🎬 <b><a href='{show['url']}'>{html.escape(show['name'])}</a></b>{year}",
+                parse_mode="HTML"
+            ),
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="➕ Subscribe", callback_data=f"sub_{show['show_id']}")]
+            ])
+        ))
+
+    await inline_query.answer(results, cache_time=300)
+
+
+@router.callback_query(F.data.startswith("sub_"))
+async def cb_subscribe(callback: CallbackQuery, db):
+    show = await db.get_catalog_show(int(callback.data.split("sub_")[1]))
+    if not show:
+        await callback.answer("❌ Series not found.")
+        return
+
+    is_added = await db.add_subscription(
+        user_id=callback.from_user.id,
+        show_id=show['show_id'],
+        show_name=show['name'],
+        username=callback.from_user.username,
+        first_name=callback.from_user.first_name,
+        last_name=callback.from_user.last_name
+    )
+    if is_added:
+        await callback.answer(f"✅ Subscribed to {show['name']}!")
+    else:
+        await callback.answer(f"ℹ️ You are already subscribed to {show['name']}.")
+
+
 @router.message(Command("list"))
 async def cmd_list(message: Message, db):
     await show_user_list(message, db)
@@ -137,8 +187,28 @@ async def cb_list(callback: CallbackQuery, db):
     await callback.answer()
 
 
-async def show_user_list(message_obj: Message, db):
-    subs = await db.get_user_subscriptions(message_obj.chat.id)
+@router.callback_query(F.data.startswith("list_"))
+async def cb_list_page(callback: CallbackQuery, db):
+    await show_user_list(callback.message, db, int(callback.data.split("list_")[1]))
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("lprev_"))
+async def cb_list_prev(callback: CallbackQuery, db):
+    after = int(callback.data.split("lprev_")[1])
+    start = await db.get_previous_page_start(callback.message.chat.id, after, LIST_PAGE_SIZE)
+    await show_user_list(callback.message, db, start)
+    await callback.answer()
+
+
+async def show_user_list(message_obj: Message, db, after=0):
+    # One page at a time, keyed by the last show_id before it. Buttons carry
+    # show_ids, show names can overflow the 64-byte callback_data limit.
+    subs = await db.get_subscriptions_page(message_obj.chat.id, after, LIST_PAGE_SIZE + 1)
+    if not subs and after:
+        # The last show of the last page was deleted, step back a page
+        after = await db.get_previous_page_start(message_obj.chat.id, after, LIST_PAGE_SIZE)
+        subs = await db.get_subscriptions_page(message_obj.chat.id, after, LIST_PAGE_SIZE + 1)
 
     if not subs:
         try:
@@ -147,9 +217,18 @@ async def show_user_list(message_obj: Message, db):
             await message_obj.answer("Your list is empty.", reply_markup=get_main_keyboard())
         return
 
+    page = subs[:LIST_PAGE_SIZE]
     buttons = []
-    for show_name, show_id in subs:
-        buttons.append([InlineKeyboardButton(text=f"❌ {show_name}", callback_data=f"del_{show_name}")])
+    for show_id, show_name in page:
+        buttons.append([InlineKeyboardButton(text=f"❌ {show_name}", callback_data=f"del_{show_id}_{after}")])
+
+    nav = []
+    if after:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"lprev_{after}"))
+    if len(subs) > LIST_PAGE_SIZE:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"list_{page[-1]['show_id']}"))
+    if nav:
+        buttons.append(nav)
     buttons.append([InlineKeyboardButton(text="🔙 Menu", callback_data="btn_menu")])
 
     try:
@@ -160,10 +239,16 @@ async def show_user_list(message_obj: Message, db):
 
 @router.callback_query(F.data.startswith("del_"))
 async def cb_delete(callback: CallbackQuery, db):
-    show_name = callback.data.split("del_")[1]
-    await db.delete_subscription(callback.from_user.id, show_name)
-    await callback.answer(f"{show_name} deleted!")
-    await cb_list(callback, db)
+    try:
+        show_id, after = map(int, callback.data.split("del_")[1].split("_"))
+    except ValueError:
+        # A button from before lists were paged, show the fresh list instead
+        await cb_list(callback, db)
+        return
+
+    show_name = await db.delete_subscription(callback.from_user.id, show_id)
+    await callback.answer(f"{show_name} deleted!" if show_name else "Already deleted.")
+    await show_user_list(callback.message, db, after)
 
 
 
@@ -186,20 +271,19 @@ async def show_calendar(message_obj: Message, db):
     except:
         msg = await message_obj.answer("⏳ Checking release dates...")
 
-    subs = await db.get_user_subscriptions(message_obj.chat.id)
-    if not subs:
+    # Filled in by the scheduler sweep, no TVMaze calls here
+    rows = await db.get_user_calendar(message_obj.chat.id)
+    if not rows:
         await msg.edit_text("List is empty.", reply_markup=get_main_keyboard())
         return
 
     report = []
-    for show_name, show_id in subs:
-        next_ep = await TVMazeClient.get_next_episode(show_id)
-        if next_ep:
-            date = next_ep.get('airdate', '???')
-            s_num = f"S{next_ep.get('season')}E{next_ep.get('number')}"
-            report.append(f"📅 <b>{date}</b>: {show_name} ({s_num})")
-
-    report.sort()
+    for show_name, episode_id, season, number, airdate in rows:
+        if not episode_id:
+            continue
+        date = airdate.isoformat() if airdate else '???'
+        report.append(f"📅 <b>{date}</b>: {show_name} (S{season}E{number})")
+
     result_text = "<b>🗓 Upcoming releases:</b>\n\n" + ("\n".join(report) if report else "No upcoming releases found.")
 
     kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Menu", callback_data="btn_menu")]])
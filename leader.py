@@ -0,0 +1,46 @@
+import asyncio
+import asyncpg
+import logging
+from config import LEADER_RETRY_INTERVAL, LEADER_HEARTBEAT_INTERVAL
+
+
+class LeaderElection:
+    # Runs a job on exactly one replica at a time. The advisory lock lives as
+    # long as its dedicated session, so if the leader dies Postgres releases
+    # it and one of the standbys polling pg_try_advisory_lock takes over.
+    def __init__(self, dsn, name, lock_id):
+        self.dsn = dsn
+        self.name = name
+        self.lock_id = lock_id
+
+    async def run(self, job):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                while not await conn.fetchval('SELECT pg_try_advisory_lock($1)', self.lock_id):
+                    await asyncio.sleep(LEADER_RETRY_INTERVAL)
+
+                logging.info(f"👑 Leader for {self.name}")
+                await self._run_while_locked(conn, job)
+                return
+            except Exception as e:
+                logging.error(f"⚠️ Leader election error ({self.name}): {e}")
+            finally:
+                if conn:
+                    await conn.close()
+
+            await asyncio.sleep(LEADER_RETRY_INTERVAL)
+
+    async def _run_while_locked(self, conn, job):
+        task = asyncio.create_task(job())
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=LEADER_HEARTBEAT_INTERVAL)
+                if not task.done():
+                    # If the session is gone so is the lock, stop before another replica starts
+                    await conn.fetchval('SELECT 1', timeout=LEADER_HEARTBEAT_INTERVAL)
+            task.result()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
\ No newline at end of file
@@ -2,10 +2,20 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand, BotCommandScopeDefault
-from config import BOT_TOKEN, DATABASE_URL
+from config import (
+    BOT_TOKEN, DATABASE_URL, WEBHOOK_URL, WEBHOOK_SECRET, SHARD_INDEX, SCHEDULER_LOCK_ID, CATALOG_LOCK_ID,
+    METRICS_HOST, METRICS_PORT
+)
 from database import Database
+from api import TVMazeClient
 from handlers import router
 from scheduler import UpdateChecker
+from delivery import NotificationQueue
+from catalog import CatalogSync
+from profiles import ProfileBuffer
+from webhook import run_webhook
+from leader import LeaderElection
+from metrics import HandlerTimingMiddleware, start_metrics_server, track_cache_hit_ratio
 
 async def set_commands(bot: Bot):
     commands = [
@@ -22,23 +32,65 @@ async def main():
 
     if not DATABASE_URL:
         raise ValueError("NO_DATABASE_URL_ERROR")
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise ValueError("NO_WEBHOOK_SECRET_ERROR")
 
     db = Database(DATABASE_URL)
 
     await db.connect()
 
+    tvmaze = TVMazeClient(db=db)
+    await tvmaze.start()
+    await tvmaze.warm_search_cache()
+
+    profiles = ProfileBuffer(db)
+    await profiles.start()
+
     bot = Bot(token=BOT_TOKEN)
     dp = Dispatcher()
 
+    for observer in (router.message, router.callback_query, router.inline_query):
+        observer.middleware(HandlerTimingMiddleware())
     dp.include_router(router)
     dp["db"] = db
+    dp["tvmaze"] = tvmaze
+    dp["profiles"] = profiles
 
     await set_commands(bot)
 
-    checker = UpdateChecker(bot, db)
-    asyncio.create_task(checker.start())
+    notifier = NotificationQueue(bot, db)
+    await notifier.start()
+
+    checker = UpdateChecker(db, tvmaze, notifier)
+    track_cache_hit_ratio('poster', lambda: notifier.posters.hit_rate)
+    track_cache_hit_ratio('render', lambda: checker.renderer.hit_rate)
+    track_cache_hit_ratio('search', lambda: tvmaze.searches.hit_rate)
+    track_cache_hit_ratio('search_db', lambda: tvmaze.search_db_hit_rate)
+    track_cache_hit_ratio('http', lambda: tvmaze.responses.hit_rate)
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+    scheduler_leader = LeaderElection(DATABASE_URL, f"scheduler shard {SHARD_INDEX}", SCHEDULER_LOCK_ID + SHARD_INDEX)
+    checker_task = asyncio.create_task(scheduler_leader.run(checker.start))
+    catalog_leader = LeaderElection(DATABASE_URL, "catalog", CATALOG_LOCK_ID)
+    catalog_task = asyncio.create_task(catalog_leader.run(CatalogSync(db, tvmaze).start))
 
-    await dp.start_polling(bot)
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(bot, dp)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        checker_task.cancel()
+        catalog_task.cancel()
+        await asyncio.gather(checker_task, catalog_task, return_exceptions=True)
+        await notifier.close()
+        await profiles.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await tvmaze.close()
+        await bot.session.close()
+        await db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,70 @@
+import functools
+import inspect
+import time
+from aiohttp import web
+from aiogram import BaseMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+SWEEP_SECONDS = Histogram(
+    'pekseries_sweep_seconds', 'Duration of one update sweep',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 900, 1800)
+)
+SWEEP_SHOWS_POLLED = Gauge('pekseries_sweep_shows_polled', 'Shows polled in the last sweep')
+SWEEP_SHOWS_TOTAL = Gauge('pekseries_sweep_shows_subscribed', 'Subscribed shows seen in the last sweep')
+
+TVMAZE_SECONDS = Histogram('pekseries_tvmaze_request_seconds', 'TVMaze request latency', ['endpoint'])
+TVMAZE_RESPONSES = Counter('pekseries_tvmaze_responses_total', 'TVMaze responses', ['endpoint', 'status'])
+
+DB_SECONDS = Histogram('pekseries_db_query_seconds', 'Database method latency', ['method'])
+
+NOTIFICATIONS_SENT = Counter('pekseries_notifications_sent_total', 'Notifications delivered')
+NOTIFICATION_ERRORS = Counter('pekseries_notification_errors_total', 'Failed notification sends', ['reason'])
+
+HANDLER_SECONDS = Histogram('pekseries_handler_seconds', 'Telegram update handler latency', ['handler'])
+
+CACHE_HIT_RATIO = Gauge('pekseries_cache_hit_ratio', 'Cache hit ratio since start', ['cache'])
+
+
+def timed_methods(histogram, exclude=()):
+    # Class decorator: observes every public coroutine method under its own name
+    def decorate(cls):
+        for name, func in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not inspect.iscoroutinefunction(func):
+                continue
+            setattr(cls, name, _timed(histogram.labels(name), func))
+        return cls
+    return decorate
+
+
+def _timed(metric, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with metric.time():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def track_cache_hit_ratio(name, hit_rate):
+    CACHE_HIT_RATIO.labels(name).set_function(hit_rate)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+async def start_metrics_server(host, port):
+    async def handle_metrics(request):
+        return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
\ No newline at end of file
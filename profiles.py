@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from config import PROFILE_FLUSH_INTERVAL, PROFILE_TTL
+
+
+class ProfileBuffer:
+    # Write-behind buffer for the users table. Handlers only record the
+    # profile here: repeats within a flush collapse into one row, profiles
+    # written recently and unchanged are dropped, and the rest go out in a
+    # single executemany every PROFILE_FLUSH_INTERVAL and on close().
+    def __init__(self, db):
+        self.db = db
+        self.pending = {}
+        # user_id -> (profile, written_at), oldest write first
+        self.written = OrderedDict()
+        self.task = None
+
+    def put(self, user_id, username, first_name, last_name):
+        profile = (username, first_name, last_name)
+        written = self.written.get(user_id)
+        if written and written[0] == profile and time.monotonic() - written[1] < PROFILE_TTL:
+            return
+        self.pending[user_id] = profile
+
+    async def start(self):
+        self.task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(PROFILE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Profile flush error: {e}")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            await self.db.upsert_users([(user_id, *profile) for user_id, profile in pending.items()])
+        except BaseException:
+            # Put them back for the next flush, profiles recorded meanwhile are newer
+            self.pending = {**pending, **self.pending}
+            raise
+
+        now = time.monotonic()
+        for user_id, profile in pending.items():
+            self.written[user_id] = (profile, now)
+            self.written.move_to_end(user_id)
+        while self.written and now - next(iter(self.written.values()))[1] >= PROFILE_TTL:
+            self.written.popitem(last=False)
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+# Token bucket shared by all callers. backoff() (on a 429 or flood-control
+# error) empties the bucket and blocks everyone until the delay has passed,
+# then it refills at the normal rate.
+class RateLimiter:
+    def __init__(self, calls, period):
+        self.capacity = calls
+        self.rate = calls / period
+        self.tokens = float(calls)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, delay):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        # Refill from the end of the block, not from the last acquire: otherwise
+        # a full bucket's burst goes out the moment the block lifts
+        self.tokens = 0.0
+        self.updated = self.blocked_until
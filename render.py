@@ -0,0 +1,109 @@
+import html
+import re
+from collections import OrderedDict
+from config import RENDER_CACHE_SIZE
+
+TAG_RE = re.compile(r'<[^>]+>')
+SUMMARY_LIMIT = 200
+# Telegram's cap on a message text, in UTF-16 code units
+MESSAGE_LIMIT = 4096
+
+
+def clean_summary(raw_summary):
+    # TVMaze summaries are HTML: drop the tags, decode entities so the length
+    # limit counts real characters, then escape again for parse_mode="HTML"
+    if not raw_summary:
+        return ""
+    text = html.unescape(TAG_RE.sub('', raw_summary)).strip()
+    if len(text) > SUMMARY_LIMIT:
+        text = text[:SUMMARY_LIMIT] + "..."
+    return html.escape(text, quote=False)
+
+
+def render_notification(show_name, ep):
+    year = ep.get('show_year', '')
+    year_str = f" ({year})" if year else ""
+
+    return (
+        f"🔥 <b>New Episode!</b>\n"
+        f"🎬 Series: <b>{html.escape(show_name, quote=False)}{year_str}</b>\n"
+        f"🔢 Season {ep.get('season')} - Episode{ep.get('number')}\n"
+        f"📝 <b>{html.escape(str(ep.get('name')), quote=False)}</b>\n\n"
+        f"<i>{clean_summary(ep.get('summary'))}</i>"
+    )
+
+
+def render_episode_line(show_name, ep):
+    year = ep.get('show_year', '')
+    year_str = f" ({year})" if year else ""
+    return (
+        f"🎬 <b>{html.escape(show_name, quote=False)}{year_str}</b>\n"
+        f"🔢 S{ep.get('season')}E{ep.get('number')} - {html.escape(str(ep.get('name')), quote=False)}"
+    )
+
+
+def render_digest_header(count):
+    return f"🔥 <b>{count} New Episodes!</b>"
+
+
+def render_digest(entries):
+    # entries: [(show_name, ep), ...], one text message for the whole batch
+    lines = [render_digest_header(len(entries))]
+    lines.extend(render_episode_line(show_name, ep) for show_name, ep in entries)
+    return "\n\n".join(lines)
+
+
+def text_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_digest(entries, limit=MESSAGE_LIMIT):
+    # Yields (start, stop) of consecutive runs of entries whose render_digest
+    # fits in one message. Lengths include the HTML tags, so they can only
+    # overestimate what Telegram counts after parsing.
+    header = text_length(render_digest_header(len(entries)))
+    start, size = 0, header
+    for i, (show_name, ep) in enumerate(entries):
+        line = text_length(render_episode_line(show_name, ep)) + 2
+        if i > start and size + line > limit:
+            yield start, i
+            start, size = i, header
+        size += line
+    if start < len(entries):
+        yield start, len(entries)
+
+
+def render_album_captions(entries):
+    # Album captions are shown per photo, keep them short and put the header on the first
+    captions = [render_episode_line(show_name, ep) for show_name, ep in entries]
+    captions[0] = f"{render_digest_header(len(entries))}\n\n{captions[0]}"
+    return captions
+
+
+class NotificationRenderer:
+    # Every subscriber of an episode gets the same text, render it once
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, show_name, ep):
+        key = (ep['id'], show_name)
+        msg = self.cache.get(key)
+        if msg is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return msg
+
+        self.misses += 1
+        msg = render_notification(show_name, ep)
+        self.cache[key] = msg
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return msg
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
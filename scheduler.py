@@ -1,72 +1,205 @@
 import asyncio
+import itertools
 import logging
-import re
-from config import CHECK_INTERVAL
-from api import TVMazeClient
+import time
+from config import (
+    CHECK_INTERVAL, SWEEP_CONCURRENCY, FULL_SWEEP_INTERVAL, SHARD_COUNT, SHARD_INDEX,
+    OUTBOX_PAGE_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETENTION,
+    DIGEST_MODE, DIGEST_WINDOW, DIGEST_ALBUM_SIZE
+)
+from metrics import SWEEP_SECONDS, SWEEP_SHOWS_POLLED, SWEEP_SHOWS_TOTAL
+from render import NotificationRenderer, render_album_captions, render_digest, split_digest
 
 
 class UpdateChecker:
-    def __init__(self, bot, db):
-        self.bot = bot
+    def __init__(self, db, tvmaze, notifier, digest=DIGEST_MODE, digest_window=DIGEST_WINDOW):
         self.db = db
+        self.tvmaze = tvmaze
+        self.notifier = notifier
+        self.digest = digest
+        self.digest_window = digest_window
+        self.synced_at = None
+        self.outbox_ready = asyncio.Event()
+        self.renderer = NotificationRenderer()
 
     async def start(self):
         logging.info("🚀 Planner started")
+        # Also resends whatever a previous run left in the outbox
+        drain_task = asyncio.create_task(self._drain_outbox())
+        try:
+            await self._run_sweeps()
+        finally:
+            # Cancelled when leadership is lost, too: whatever is still queued
+            # belongs to the next leader now
+            drain_task.cancel()
+            await asyncio.gather(drain_task, return_exceptions=True)
+            self.notifier.discard_queued()
+
+    async def _run_sweeps(self):
         while True:
             try:
-                logging.info("⏳ Check updates...")
+                await self.sweep()
+                logging.info(f"✅ Check completed. Next check in {CHECK_INTERVAL} sec.")
+                logging.info(f"🖼 Poster cache hit rate: {self.notifier.posters.hit_rate:.0%}")
+
+            except Exception as e:
+                logging.error(f"⚠️ Critic error in planner: {e}")
+                await asyncio.sleep(60)
+                continue
 
-                subs = await self.db.get_all_subscriptions()
-                unique_show_ids = set(sub[1] for sub in subs)
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def sweep(self):
+        logging.info("⏳ Check updates...")
+        started = time.monotonic()
 
-                latest_episodes = {}
-                for show_id in unique_show_ids:
-                    ep_data = await TVMazeClient.get_latest_episode_with_info(show_id)
-                    if ep_data:
-                        latest_episodes[show_id] = ep_data
-                    await asyncio.sleep(0.5)
+        shows = await self.db.get_subscribed_shows(SHARD_COUNT, SHARD_INDEX)
+        show_ids = await self._shows_to_poll(shows)
+        logging.info(f"🔎 Polling {len(show_ids)} of {len(shows)} shows")
+        SWEEP_SHOWS_TOTAL.set(len(shows))
+        SWEEP_SHOWS_POLLED.set(len(show_ids))
 
-                for user_id, show_id, show_name, last_ep_id in subs:
-                    if show_id in latest_episodes:
-                        ep = latest_episodes[show_id]
+        async for show_id, episodes in self._fetch_episodes(show_ids):
+            if not episodes:
+                continue
 
-                        if ep['id'] != last_ep_id:
-                            await self._send_notification(user_id, show_name, ep)
-                            await self.db.update_last_episode(user_id, show_id, ep['id'])
+            ep, next_ep, updated = episodes
+            await self.db.set_upcoming_episode(show_id, next_ep)
+            if ep:
+                await self._fan_out(show_id, ep)
+            # Also for shows with nothing aired yet, or they'd never leave the poll list
+            await self.db.set_show_update_time(show_id, updated, ep['id'] if ep else None)
 
-                logging.info(f"✅ Check completed. Next check in {CHECK_INTERVAL} sec.")
+        if self.digest:
+            # Digests are built once the whole cycle has been detected
+            self.outbox_ready.set()
+        await self.db.prune_outbox(OUTBOX_RETENTION, OUTBOX_MAX_ATTEMPTS)
+        SWEEP_SECONDS.observe(time.monotonic() - started)
 
+    async def _shows_to_poll(self, shows):
+        # Only shows that TVMaze reports as changed since we last looked at them.
+        # Falls back to a full sweep on startup, when the updates feed is
+        # unavailable, or when the feed window no longer covers our last sync.
+        updates = await self.tvmaze.get_show_updates('day')
+        now = time.monotonic()
+        full_sweep = updates is None or self.synced_at is None or now - self.synced_at > FULL_SWEEP_INTERVAL
+        self.synced_at = now
+        if full_sweep:
+            return list(shows)
+
+        known = await self.db.get_show_update_times(shows.keys())
+        return [
+            show_id for show_id, due in shows.items()
+            if due
+            or show_id not in known
+            or updates.get(show_id, 0) > known[show_id]
+        ]
+
+    async def _fan_out(self, show_id, ep):
+        # Detection only records who needs this episode, _drain_outbox sends it
+        await self.db.save_episode(show_id, ep)
+        if await self.db.enqueue_outbox(show_id, ep['id']) and not self.digest:
+            self.outbox_ready.set()
+
+    async def _drain_outbox(self):
+        drain = self._drain_digests_once if self.digest else self._drain_outbox_once
+        # A digest window has to be rechecked on its own schedule, not only after sweeps
+        timeout = min(CHECK_INTERVAL, self.digest_window) if self.digest and self.digest_window else CHECK_INTERVAL
+        while True:
+            self.outbox_ready.clear()
+            try:
+                await drain()
             except Exception as e:
-                logging.error(f"⚠️ Critic error in planner: {e}")
-                await asyncio.sleep(60)
+                logging.error(f"⚠️ Outbox drain error: {e}")
+
+            try:
+                await asyncio.wait_for(self.outbox_ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _load_episode(self, episodes, episode_id):
+        if episode_id not in episodes:
+            episodes[episode_id] = await self.db.get_episode(episode_id)
+        return episodes[episode_id]
+
+    async def _drain_outbox_once(self):
+        # Rows still queued, awaiting their ack, or acked after the page was
+        # read are skipped by the notifier, and last_episode_id only moves
+        # once the send is confirmed
+        episodes = {}
+        last_id = 0
+        while True:
+            self.notifier.forget_acked()
+            rows = await self.db.get_outbox_page(
+                last_id, OUTBOX_PAGE_SIZE, OUTBOX_MAX_ATTEMPTS, SHARD_COUNT, SHARD_INDEX
+            )
+            if not rows:
+                return
+
+            for row in rows:
+                ep = await self._load_episode(episodes, row['episode_id'])
+                msg = self.renderer.render(row['show_name'], ep)
+                await self.notifier.put(row['user_id'], row['show_id'], row['episode_id'], msg, ep.get('show_image'))
+            last_id = rows[-1]['id']
+
+    async def _drain_digests_once(self):
+        # Same as _drain_outbox_once, but each user's pending episodes go out
+        # together: one text message, or an album when every show has a poster
+        episodes = {}
+        last_user_id = 0
+        while True:
+            self.notifier.forget_acked()
+            rows = await self.db.get_outbox_digest_page(
+                last_user_id, OUTBOX_PAGE_SIZE, OUTBOX_MAX_ATTEMPTS, self.digest_window,
+                SHARD_COUNT, SHARD_INDEX
+            )
+            if not rows:
+                return
+
+            for user_id, user_rows in itertools.groupby(rows, key=lambda row: row['user_id']):
+                pending = [(row, await self._load_episode(episodes, row['episode_id'])) for row in user_rows]
+                await self._put_digest(user_id, pending)
+            last_user_id = rows[-1]['user_id']
+
+    async def _put_digest(self, user_id, pending):
+        # Episodes a digest already failed to deliver go out one by one, so a
+        # digest Telegram keeps rejecting can't hold them all back
+        chunks = [[entry] for entry in pending if entry[0]['attempts']]
+        pending = [entry for entry in pending if not entry[0]['attempts']]
+        entries = [(row['show_name'], ep) for row, ep in pending]
+        chunks += [pending[start:stop] for start, stop in split_digest(entries)]
+
+        for chunk in chunks:
+            if len(chunk) == 1:
+                row, ep = chunk[0]
+                msg = self.renderer.render(row['show_name'], ep)
+                await self.notifier.put(user_id, row['show_id'], row['episode_id'], msg, ep.get('show_image'))
                 continue
 
-            await asyncio.sleep(CHECK_INTERVAL)
+            items = [(row['show_id'], row['episode_id']) for row, _ in chunk]
+            entries = [(row['show_name'], ep) for row, ep in chunk]
+            media = None
+            if 2 <= len(chunk) <= DIGEST_ALBUM_SIZE and all(ep.get('show_image') for _, ep in chunk):
+                media = tuple(
+                    (row['show_id'], ep['show_image'], caption)
+                    for (row, ep), caption in zip(chunk, render_album_captions(entries))
+                )
+            await self.notifier.put_digest(user_id, items, render_digest(entries), media)
+
+    async def _fetch_episodes(self, show_ids):
+        # Yields (show_id, (latest, next)) as soon as each fetch finishes, so fan-out
+        # starts before the whole sweep is done. Pacing is left to the client's
+        # rate limiter, the semaphore only bounds in-flight requests.
+        sem = asyncio.Semaphore(SWEEP_CONCURRENCY)
 
-    async def _send_notification(self, user_id, show_name, ep):
-        raw_summary = ep.get('summary', '')
-        clean_summary = ""
-        if raw_summary:
-            clean_summary = re.sub(r'<[^>]+>', '', raw_summary)
-            if len(clean_summary) > 200:
-                clean_summary = clean_summary[:200] + "..."
-
-        year = ep.get('show_year', '')
-        year_str = f" ({year})" if year else ""
-
-        msg = (
-            f"🔥 <b>New Episode!</b>\n"
-            f"🎬 Series: <b>{show_name}{year_str}</b>\n"
-            f"🔢 Season {ep.get('season')} - Episode{ep.get('number')}\n"
-            f"📝 <b>{ep.get('name')}</b>\n\n"
-            f"<i>{clean_summary}</i>"
-        )
+        async def fetch(show_id):
+            async with sem:
+                return show_id, await self.tvmaze.get_episodes(show_id)
 
+        tasks = [asyncio.create_task(fetch(show_id)) for show_id in show_ids]
         try:
-            image_url = ep.get('show_image')
-            if image_url:
-                await self.bot.send_photo(user_id, photo=image_url, caption=msg, parse_mode="HTML")
-            else:
-                await self.bot.send_message(user_id, msg, parse_mode="HTML")
-        except Exception as e:
-            logging.error(f"Send error {user_id}: {e}")
\ No newline at end of file
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import signal
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_MAX_IN_FLIGHT
+)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    # Handles each update inside the request so Telegram gets backpressure
+    # instead of us piling up an unbounded number of background tasks.
+    def __init__(self, dispatcher, bot, max_in_flight, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=False, **kwargs)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def handle(self, request):
+        async with self.semaphore:
+            return await super().handle(request)
+
+    async def close(self):
+        # main() closes the bot session once the notifier has drained
+        pass
+
+
+async def run_webhook(bot, dp):
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp, bot, max_in_flight=WEBHOOK_MAX_IN_FLIGHT, secret_token=WEBHOOK_SECRET
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app, shutdown_timeout=30)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+
+    # Every replica sets the same URL, the load balancer spreads the updates
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_IN_FLIGHT,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logging.info(f"🌐 Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        logging.info("🛑 Stopping webhook server...")
+        await runner.cleanup()
\ No newline at end of file